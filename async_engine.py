@@ -0,0 +1,189 @@
+"""
+Async engine
+
+SQLAlchemy 1.3 has no asyncio support, so statements are still built and
+compiled by SQLAlchemy (for the PostgreSQL dialect) and then executed on an
+asyncpg connection pool. The API layer awaits them directly instead of
+pushing the synchronous engine onto threads.
+
+    engine = await create_async_engine()
+    rows = await engine.fetch_all(select([Recipe.recipe_name]))
+    await engine.dispose()
+
+Configured from the same environment as engine.py (DATABASE_URL / PG*,
+DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_STATEMENT_TIMEOUT_MS),
+the pool holds between pool_size and pool_size + max_overflow connections.
+Every connection of the pool can run a statement at the same time, so
+independent queries gathered with asyncio.gather() run concurrently.
+
+Rows are asyncpg Records, indexed by position or column name. Statements
+are timed into metrics.registry like the synchronous engine's.
+
+Compiled statements use $n placeholders in the order their parameters first
+appear, expanding IN parameters become = ANY($n) with the list bound as one
+array so the SQL doesn't change with the number of values. interval values
+are sent and read as text, so intervals like "1 month" which no timedelta can
+hold can be bound.
+"""
+import re
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+
+import metrics
+from engine import engine_config
+
+_PLACEHOLDER = re.compile(r"(NOT )?IN \(\[EXPANDING_([^\]]+)\]\)|%\(([^)]+)\)s|%%")
+
+
+def _no_execute(sql, *multiparams, **params):
+    raise RuntimeError("statements are executed with the async engine")
+
+
+# compile only, never connects
+compile_engine = create_engine("postgresql://", strategy="mock", executor=_no_execute)
+
+
+def compile_statement(stmt, dialect=None):
+    """
+    (sql, args) of a Core statement or Query for asyncpg.
+    """
+    if hasattr(stmt, "statement"):
+        stmt = stmt.statement
+    compiled = stmt.compile(dialect=dialect or compile_engine.dialect)
+    params = compiled.construct_params()
+    processors = compiled._bind_processors
+    args = []
+    positions = {}
+
+    def position(name):
+        if name not in positions:
+            value = params[name]
+            if name in processors and not compiled.binds[name].expanding:
+                value = processors[name](value)
+            args.append(value)
+            positions[name] = len(args)
+        return f"${positions[name]}"
+
+    def replace(match):
+        negated, expanding, name = match.groups()
+        if expanding is not None:
+            operator = "<> ALL" if negated else "= ANY"
+            return f"{operator}({position(expanding)})"
+        if name is not None:
+            return position(name)
+        return "%"
+
+    return _PLACEHOLDER.sub(replace, compiled.string), args
+
+
+def _encode_interval(value):
+    if isinstance(value, str):
+        return value
+    return f"{value.total_seconds()} seconds"
+
+
+async def _init_connection(connection):
+    await connection.set_type_codec(
+        "interval",
+        schema="pg_catalog",
+        encoder=_encode_interval,
+        decoder=str,
+        format="text",
+    )
+
+
+def async_url(url):
+    """
+    The asyncpg dsn of a SQLAlchemy postgresql url.
+    """
+    url = make_url(url)
+    if url.get_backend_name() != "postgresql":
+        raise ValueError(f"the async engine needs postgresql, not {url.drivername}")
+    url.drivername = "postgresql"
+    return str(url)
+
+
+class AsyncEngine:
+    def __init__(self, pool, acquire_timeout=None):
+        self.pool = pool
+        self.acquire_timeout = acquire_timeout
+
+    def connect(self):
+        """
+        async with engine.connect() as connection - a pooled asyncpg
+        connection.
+        """
+        return self.pool.acquire(timeout=self.acquire_timeout)
+
+    async def _run(self, method, stmt, connection=None):
+        sql, args = compile_statement(stmt)
+        start = time.perf_counter()
+        if connection is None:
+            async with self.connect() as connection:
+                result = await getattr(connection, method)(sql, *args)
+        else:
+            result = await getattr(connection, method)(sql, *args)
+        rows = len(result) if isinstance(result, list) else 0
+        metrics.registry.observe_statement(
+            metrics.fingerprint(sql), time.perf_counter() - start, rows
+        )
+        return result
+
+    async def fetch_all(self, stmt, connection=None):
+        return await self._run("fetch", stmt, connection)
+
+    async def fetch_one(self, stmt, connection=None):
+        return await self._run("fetchrow", stmt, connection)
+
+    async def scalar(self, stmt, connection=None):
+        return await self._run("fetchval", stmt, connection)
+
+    async def execute(self, stmt, connection=None):
+        """
+        Execute a statement returning no rows, returns the status string
+        ("INSERT 0 1").
+        """
+        return await self._run("execute", stmt, connection)
+
+    async def stream(self, stmt, batch_size=10000):
+        """
+        Async generator of lists of at most batch_size rows, fetched through
+        a server side cursor - see core/streaming.py.
+        """
+        sql, args = compile_statement(stmt)
+        async with self.connect() as connection:
+            async with connection.transaction():
+                cursor = await connection.cursor(sql, *args)
+                while True:
+                    rows = await cursor.fetch(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    async def dispose(self):
+        await self.pool.close()
+
+
+async def create_async_engine(**overrides):
+    """
+    Create an asyncpg backed AsyncEngine from engine_config(), keyword
+    overrides as for engine.build_engine().
+    """
+    import asyncpg
+
+    config = engine_config()
+    config.update(overrides)
+
+    server_settings = {}
+    if config["statement_timeout_ms"]:
+        server_settings["statement_timeout"] = str(config["statement_timeout_ms"])
+    pool = await asyncpg.create_pool(
+        async_url(config["url"]),
+        min_size=config["pool_size"],
+        max_size=config["pool_size"] + config["max_overflow"],
+        server_settings=server_settings,
+        init=_init_connection,
+    )
+    return AsyncEngine(pool, acquire_timeout=config["pool_timeout"])
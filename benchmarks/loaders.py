@@ -0,0 +1,269 @@
+"""
+Relationship loading benchmark.
+
+Loads User.addresses and ExecutedRecipe.recipe / .ingredient with each loader
+strategy and measures statements emitted, rows fetched, wall time and peak
+python memory:
+
+- lazy      one SELECT per parent as the relationship is touched (N + 1)
+- joined    LEFT OUTER JOIN, parent columns repeated for every child row
+- subquery  a second SELECT re-running the parent query as a subquery
+- selectin  SELECT ... WHERE parent_id IN (...) per chunk of parents
+
+selectin runs once per --chunk size. Run from the repository root against a
+scratch database (the tables are emptied):
+
+    python -m benchmarks.loaders --url sqlite:////tmp/loaders.db \\
+        --sizes 100,1000,10000 --fanouts 1,10,50
+
+Pick the winner per relationship and set it in orm.models.LOADER_STRATEGIES.
+"""
+import argparse
+import datetime as dt
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, lazyload, joinedload, subqueryload, selectinload
+from sqlalchemy.orm.strategies import SelectInLoader
+
+from engine import build_engine
+from orm.bulk import bulk_insert
+from orm.models import Base, User, Address, Recipe, Ingredient, ExecutedRecipe
+
+STRATEGIES = {
+    "lazy": lazyload,
+    "joined": joinedload,
+    "subquery": subqueryload,
+    "selectin": selectinload,
+}
+
+
+class _CountingCursor:
+    """
+    DBAPI cursor proxy counting the rows fetched through it.
+    """
+
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._counter["rows"] += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._counter["rows"] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._counter["rows"] += len(rows)
+        return rows
+
+
+def instrument(engine):
+    """
+    Count statements and fetched rows on engine, returns the counter dict.
+    """
+    counter = {"statements": 0, "rows": 0}
+    base = engine.dialect.execution_ctx_cls
+
+    class CountingExecutionContext(base):
+        def create_cursor(self):
+            return _CountingCursor(super().create_cursor(), counter)
+
+    engine.dialect.execution_ctx_cls = CountingExecutionContext
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statement(*args):
+        counter["statements"] += 1
+
+    return counter
+
+
+@contextmanager
+def selectin_chunksize(size):
+    original = SelectInLoader._chunksize
+    SelectInLoader._chunksize = size
+    try:
+        yield
+    finally:
+        SelectInLoader._chunksize = original
+
+
+def generate_data(engine, size, fanout):
+    """
+    size users with fanout addresses each, and size * fanout executed recipes
+    over size recipes and fanout ingredients.
+    """
+    with engine.begin() as connection:
+        for model in (ExecutedRecipe, Recipe, Ingredient, Address, User):
+            connection.execute(model.__table__.delete())
+        bulk_insert(
+            connection,
+            User,
+            ((i, f"user {i}", f"User {i}") for i in range(1, size + 1)),
+            columns=["id", "name", "full_name"],
+        )
+        bulk_insert(
+            connection,
+            Address,
+            (
+                (f"{i}.{j}@example.com", i)
+                for i in range(1, size + 1)
+                for j in range(fanout)
+            ),
+        )
+        bulk_insert(
+            connection,
+            Recipe,
+            ((i, f"recipe {i}") for i in range(1, size + 1)),
+            columns=["id", "recipe_name"],
+        )
+        bulk_insert(
+            connection,
+            Ingredient,
+            ((i, f"ingredient {i}") for i in range(1, fanout + 1)),
+            columns=["id", "ingredient_name"],
+        )
+        start = dt.date(2020, 1, 1)
+        bulk_insert(
+            connection,
+            ExecutedRecipe,
+            (
+                (i, j, start, 1.0)
+                for i in range(1, size + 1)
+                for j in range(1, fanout + 1)
+            ),
+        )
+
+
+def load_addresses(session, option):
+    users = session.query(User).options(option(User.addresses)).all()
+    return sum(len(user.addresses) for user in users)
+
+
+def load_executed(session, option):
+    executed = (
+        session.query(ExecutedRecipe)
+        .options(option(ExecutedRecipe.recipe), option(ExecutedRecipe.ingredient))
+        .all()
+    )
+    return sum(
+        len(e.recipe.recipe_name) + len(e.ingredient.ingredient_name) for e in executed
+    )
+
+
+LOADS = {
+    "User.addresses": load_addresses,
+    "ExecutedRecipe.recipe/ingredient": load_executed,
+}
+
+
+def measure(engine, counter, load, option):
+    counter.update(statements=0, rows=0)
+    session = Session(bind=engine)
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        load(session, option)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        session.close()
+    return {
+        "statements": counter["statements"],
+        "rows": counter["rows"],
+        "seconds": seconds,
+        "peak_bytes": peak,
+    }
+
+
+def run_benchmark(engine, sizes, fanouts, chunks):
+    counter = instrument(engine)
+    Base.metadata.create_all(engine)
+    results = []
+    for size in sizes:
+        for fanout in fanouts:
+            generate_data(engine, size, fanout)
+            for relationship, load in LOADS.items():
+                for name, option in STRATEGIES.items():
+                    for chunk in chunks if name == "selectin" else [None]:
+                        with selectin_chunksize(chunk or SelectInLoader._chunksize):
+                            result = measure(engine, counter, load, option)
+                        result.update(
+                            relationship=relationship,
+                            strategy=name,
+                            chunk=chunk,
+                            size=size,
+                            fanout=fanout,
+                        )
+                        results.append(result)
+    return results
+
+
+def best_strategies(results):
+    """
+    The fastest (strategy, chunk) per relationship, each configuration timed
+    summed over every size and fanout. selectin runs once per chunk size, a
+    strategy is compared by its best configuration.
+    """
+    totals = {}
+    for result in results:
+        key = (result["relationship"], result["strategy"], result["chunk"])
+        totals[key] = totals.get(key, 0.0) + result["seconds"]
+    best = {}
+    for key, _ in sorted(totals.items(), key=lambda item: item[1]):
+        relationship, strategy, chunk = key
+        best.setdefault(relationship, (strategy, chunk))
+    return best
+
+
+def _ints(value):
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", help="database url, DATABASE_URL / PG* by default")
+    parser.add_argument("--sizes", type=_ints, default=[100, 1000])
+    parser.add_argument("--fanouts", type=_ints, default=[1, 10])
+    parser.add_argument("--chunks", type=_ints, default=[100, 500, 2000])
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    engine = build_engine(**({"url": args.url} if args.url else {}))
+    results = run_benchmark(engine, args.sizes, args.fanouts, args.chunks)
+
+    print(
+        f"{'relationship':<34}{'strategy':<10}{'chunk':>6}{'size':>7}{'fanout':>7}"
+        f"{'stmts':>7}{'rows':>9}{'ms':>9}{'peak KiB':>10}"
+    )
+    for r in results:
+        print(
+            f"{r['relationship']:<34}{r['strategy']:<10}{r['chunk'] or '':>6}"
+            f"{r['size']:>7}{r['fanout']:>7}{r['statements']:>7}{r['rows']:>9}"
+            f"{r['seconds'] * 1000:>9.1f}{r['peak_bytes'] / 1024:>10.0f}"
+        )
+    print("fastest overall:", best_strategies(results))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
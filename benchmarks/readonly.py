@@ -0,0 +1,119 @@
+"""
+Read only session benchmark.
+
+Runs the same queries on a Session and on an orm.readonly.ReadOnlySession and
+measures wall time, peak python memory and the identity map size left behind:
+
+- User              every user, entity query
+- ExecutedRecipe    every executed recipe, entity query
+- User, Address     users joined to their addresses, two entities per row
+
+Run from the repository root against a scratch database (the tables are
+emptied):
+
+    python -m benchmarks.readonly --url sqlite:////tmp/readonly.db \\
+        --sizes 1000,10000 --fanouts 1,10
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from sqlalchemy.orm import Session
+
+from benchmarks.loaders import _ints, generate_data
+from engine import build_engine
+from orm.models import Base, User, Address, ExecutedRecipe
+from orm.readonly import ReadOnlySession
+
+SESSIONS = {
+    "Session": Session,
+    "ReadOnlySession": ReadOnlySession,
+}
+
+
+def load_users(session):
+    return session.query(User).all()
+
+
+def load_executed(session):
+    return session.query(ExecutedRecipe).all()
+
+
+def load_user_addresses(session):
+    return session.query(User, Address).join(Address, User.id == Address.user_id).all()
+
+
+QUERIES = {
+    "User": load_users,
+    "ExecutedRecipe": load_executed,
+    "User, Address": load_user_addresses,
+}
+
+
+def measure(engine, session_class, load):
+    session = session_class(bind=engine)
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        rows = load(session)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        identities = len(session.identity_map)
+    finally:
+        tracemalloc.stop()
+        session.close()
+    return {
+        "rows": len(rows),
+        "seconds": seconds,
+        "peak_bytes": peak,
+        "identity_map": identities,
+    }
+
+
+def run_benchmark(engine, sizes, fanouts, repeat=3):
+    Base.metadata.create_all(engine)
+    results = []
+    for size in sizes:
+        for fanout in fanouts:
+            generate_data(engine, size, fanout)
+            for query, load in QUERIES.items():
+                for name, session_class in SESSIONS.items():
+                    # the best of repeat runs, the first one also warms up
+                    runs = [measure(engine, session_class, load) for _ in range(repeat)]
+                    result = min(runs, key=lambda r: r["seconds"])
+                    result.update(query=query, session=name, size=size, fanout=fanout)
+                    results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", help="database url, DATABASE_URL / PG* by default")
+    parser.add_argument("--sizes", type=_ints, default=[1000, 10000])
+    parser.add_argument("--fanouts", type=_ints, default=[1, 10])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    engine = build_engine(**({"url": args.url} if args.url else {}))
+    results = run_benchmark(engine, args.sizes, args.fanouts, args.repeat)
+
+    print(
+        f"{'query':<16}{'session':<17}{'size':>7}{'fanout':>7}{'rows':>9}"
+        f"{'ms':>9}{'peak KiB':>10}{'identities':>11}"
+    )
+    for r in results:
+        print(
+            f"{r['query']:<16}{r['session']:<17}{r['size']:>7}{r['fanout']:>7}"
+            f"{r['rows']:>9}{r['seconds'] * 1000:>9.1f}"
+            f"{r['peak_bytes'] / 1024:>10.0f}{r['identity_map']:>11}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
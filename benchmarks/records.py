@@ -0,0 +1,116 @@
+"""
+Row record benchmark.
+
+Loads every executed recipe as ORM instances, as Rows of a column query and as
+orm.records records, and measures the load time, the python memory still held
+per row once loaded and the time to read one attribute of every row:
+
+- instances       session.query(ExecutedRecipe).all()
+- rows            session.query(<its columns>).all()
+- records         fetch_records(<the column query>)
+- model records   fetch_records(session.query(ExecutedRecipe))
+- interned        fetch_records(<the column query>, intern=True)
+
+Run from the repository root against a scratch database (the tables are
+emptied):
+
+    python -m benchmarks.records --url sqlite:////tmp/records.db \\
+        --sizes 1000,10000 --fanout 10
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from sqlalchemy.orm import Session
+
+from benchmarks.loaders import _ints, generate_data
+from engine import build_engine
+from orm.models import Base, ExecutedRecipe
+from orm.records import fetch_records
+
+COLUMNS = [
+    ExecutedRecipe.id,
+    ExecutedRecipe.recipe_id,
+    ExecutedRecipe.ingredient_id,
+    ExecutedRecipe.date,
+    ExecutedRecipe.quantity,
+]
+
+LOADS = {
+    "instances": lambda session: session.query(ExecutedRecipe).all(),
+    "rows": lambda session: session.query(*COLUMNS).all(),
+    "records": lambda session: fetch_records(session.query(*COLUMNS)),
+    "model records": lambda session: fetch_records(session.query(ExecutedRecipe)),
+    "interned": lambda session: fetch_records(session.query(*COLUMNS), intern=True),
+}
+
+
+def measure(engine, load):
+    session = Session(bind=engine)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        rows = load(session)
+        seconds = time.perf_counter() - start
+        gc.collect()
+        held, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    start = time.perf_counter()
+    total = sum(row.quantity for row in rows)
+    access = time.perf_counter() - start
+    session.close()
+    return {
+        "rows": len(rows),
+        "seconds": seconds,
+        "bytes_per_row": (held - before) / max(len(rows), 1),
+        "access_seconds": access,
+        "total": total,
+    }
+
+
+def run_benchmark(engine, sizes, fanout):
+    Base.metadata.create_all(engine)
+    results = []
+    for size in sizes:
+        generate_data(engine, size, fanout)
+        for name, load in LOADS.items():
+            result = measure(engine, load)
+            result.update(load=name, size=size, fanout=fanout)
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", help="database url, DATABASE_URL / PG* by default")
+    parser.add_argument("--sizes", type=_ints, default=[1000, 10000])
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    engine = build_engine(**({"url": args.url} if args.url else {}))
+    results = run_benchmark(engine, args.sizes, args.fanout)
+
+    print(
+        f"{'load':<15}{'size':>7}{'rows':>9}{'ms':>9}{'bytes/row':>11}"
+        f"{'access ms':>11}"
+    )
+    for r in results:
+        print(
+            f"{r['load']:<15}{r['size']:>7}{r['rows']:>9}{r['seconds'] * 1000:>9.1f}"
+            f"{r['bytes_per_row']:>11.0f}{r['access_seconds'] * 1000:>11.2f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+Cross join report benchmark.
+
+Generates synthetic recipes, ingredients and executed recipes at each scale
+and runs every report of orm.queries.cross_join against them, recording
+
+- seconds   executing the report and fetching every row
+- rows      rows returned
+- peak_rss  peak resident memory of the process running the report
+- cost      the planner's total cost estimate (EXPLAIN, PostgreSQL only)
+
+Each report runs in a fresh interpreter so peak RSS is the report's own. A
+scale is recipes:ingredients:dates, each recipe uses --per-recipe
+ingredients on --density of the dates. Reports whose result would exceed
+--max-rows at a scale are skipped, the two variable reports are
+recipes x ingredients x dates rows. Run from the repository root against a
+scratch database (the tables are emptied):
+
+    python -m benchmarks.reports --url sqlite:////tmp/reports.db \\
+        --scales 10:10:30,100:100:365,1000:500:365 --json results.json
+
+and compare with a previous run, exiting 1 on a regression:
+
+    python -m benchmarks.reports ... --json new.json --compare results.json
+"""
+import argparse
+import datetime as dt
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from engine import build_engine
+from orm.bulk import bulk_insert
+from orm.models import Base, Recipe, Ingredient, ExecutedRecipe
+from orm.queries import cross_join
+from orm.summary import refresh_summary, summary_is_fresh
+
+START = dt.date(2020, 1, 1)
+
+
+def _with_dates(report, summary=False):
+    def build(session, scale, use_summary):
+        end = START + dt.timedelta(days=scale["dates"] - 1)
+        dates = cross_join.a_time_data_as_query(session, START, end, "1 day")
+        if summary:
+            return report(session, dates=dates, use_summary=use_summary)
+        return report(session, dates=dates)
+
+    return build
+
+
+def _without_dates(report, summary=False):
+    def build(session, scale, use_summary):
+        if summary:
+            return report(session, use_summary=use_summary)
+        return report(session)
+
+    return build
+
+
+# name: (builder, upper bound of the rows returned at a scale)
+REPORTS = {
+    "a_cross_join": (
+        _without_dates(cross_join.a_cross_join_query),
+        lambda s: s["executed"] * s["ingredients"],
+    ),
+    "b_cross_join_case": (
+        _without_dates(cross_join.b_cross_join_case_query),
+        lambda s: s["executed"] * s["ingredients"],
+    ),
+    "c_cross_join_group_by": (
+        _without_dates(cross_join.c_cross_join_group_by_query),
+        lambda s: s["executed"] * s["ingredients"],
+    ),
+    "full_cross_join": (
+        _without_dates(cross_join.full_cross_join_query, summary=True),
+        lambda s: s["executed"] * s["ingredients"],
+    ),
+    "b_cross_join_on_two_variables": (
+        _with_dates(cross_join.b_cross_join_on_two_variables_query, summary=True),
+        lambda s: s["executed"] * s["ingredients"] * s["dates"],
+    ),
+    "c_cross_join_group_by_on_second_var": (
+        _with_dates(cross_join.c_cross_join_group_by_on_second_var),
+        lambda s: s["recipes"] * s["ingredients"] * s["dates"],
+    ),
+    "full_cross_join_on_two_variables": (
+        _with_dates(cross_join.full_cross_join_on_two_variables_query, summary=True),
+        lambda s: s["recipes"] * s["ingredients"] * s["dates"],
+    ),
+    "grid_left_join_on_two_variables": (
+        _with_dates(cross_join.grid_left_join_on_two_variables_query, summary=True),
+        lambda s: s["recipes"] * s["ingredients"] * s["dates"],
+    ),
+}
+
+
+def parse_scale(value):
+    recipes, ingredients, dates = (int(v) for v in value.split(":"))
+    return {"recipes": recipes, "ingredients": ingredients, "dates": dates}
+
+
+def generate_data(engine, scale, per_recipe=5, density=0.1, seed=0):
+    """
+    Replace the data with a synthetic data set at scale. Returns the number
+    of executed recipe rows generated.
+    """
+    rng = random.Random(seed)
+    recipes, ingredients, days = scale["recipes"], scale["ingredients"], scale["dates"]
+    per_recipe = min(per_recipe, ingredients)
+    executed_days = max(1, round(days * density))
+
+    def executed():
+        for recipe_id in range(1, recipes + 1):
+            used = rng.sample(range(1, ingredients + 1), per_recipe)
+            for day in rng.sample(range(days), executed_days):
+                date = START + dt.timedelta(days=day)
+                for ingredient_id in used:
+                    yield recipe_id, ingredient_id, date, rng.randint(1, 500)
+
+    with engine.begin() as connection:
+        for model in (ExecutedRecipe, Recipe, Ingredient):
+            connection.execute(model.__table__.delete())
+        bulk_insert(
+            connection,
+            Recipe,
+            ((i, f"recipe {i}") for i in range(1, recipes + 1)),
+            columns=["id", "recipe_name"],
+        )
+        bulk_insert(
+            connection,
+            Ingredient,
+            ((i, f"ingredient {i}") for i in range(1, ingredients + 1)),
+            columns=["id", "ingredient_name"],
+        )
+        result = bulk_insert(connection, ExecutedRecipe, executed())
+    return result["rows"]
+
+
+def plan_cost(session, query):
+    """
+    The planner's total cost for query, None where EXPLAIN has no cost.
+    """
+    connection = session.connection()
+    if connection.dialect.name != "postgresql":
+        return None
+    compiled = query.statement.compile(dialect=connection.dialect)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+        return cursor.fetchone()[0][0]["Plan"]["Total Cost"]
+    finally:
+        cursor.close()
+
+
+def _engine(url):
+    return build_engine(metrics=False, **({"url": url} if url else {}))
+
+
+def measure(url, report, scale):
+    """
+    Run report once in this process, the result of a --measure child.
+    """
+    engine = _engine(url)
+    session = Session(bind=engine)
+    build, _ = REPORTS[report]
+    try:
+        query = build(session, scale, summary_is_fresh(session))
+        cost = plan_cost(session, query)
+        start = time.perf_counter()
+        rows = sum(1 for _ in query)
+        seconds = time.perf_counter() - start
+    finally:
+        session.close()
+        engine.dispose()
+    return {
+        "seconds": seconds,
+        "rows": rows,
+        # KiB on linux
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "cost": cost,
+    }
+
+
+def run_report(url, report, scale, timeout):
+    command = [sys.executable, "-m", "benchmarks.reports"]
+    if url:
+        command += ["--url", url]
+    command += ["--measure", report, json.dumps(scale)]
+    try:
+        out = subprocess.run(
+            command, check=True, capture_output=True, text=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return {"status": "timeout"}
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["status"] = "ok"
+    return result
+
+
+def run_benchmark(
+    url,
+    scales,
+    reports=REPORTS,
+    per_recipe=5,
+    density=0.1,
+    max_rows=5_000_000,
+    summary=False,
+    timeout=600,
+):
+    engine = _engine(url)
+    Base.metadata.create_all(engine)
+    results = []
+    for scale in scales:
+        scale = dict(scale)
+        scale["executed"] = generate_data(engine, scale, per_recipe, density)
+        if summary:
+            session = Session(bind=engine)
+            refresh_summary(session, full=True)
+            session.commit()
+            session.close()
+        for report in reports:
+            _, expected_rows = REPORTS[report]
+            result = {"report": report, "summary": summary, **scale}
+            if expected_rows(scale) > max_rows:
+                result["status"] = "skipped"
+            else:
+                result.update(run_report(url, report, scale, timeout))
+            results.append(result)
+    engine.dispose()
+    return results
+
+
+def metadata(engine):
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "revision": revision,
+        "dialect": engine.dialect.name,
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "timestamp": dt.datetime.utcnow().isoformat(timespec="seconds"),
+    }
+
+
+def _key(result):
+    return (
+        result["report"],
+        result["summary"],
+        result["recipes"],
+        result["ingredients"],
+        result["dates"],
+    )
+
+
+def compare(baseline, results, tolerance=0.2):
+    """
+    Results more than tolerance slower, or using more than tolerance more
+    memory, than the same report at the same scale in baseline.
+    """
+    previous = {_key(r): r for r in baseline["results"] if r["status"] == "ok"}
+    regressions = []
+    for result in results:
+        before = previous.get(_key(result))
+        if before is None or result["status"] != "ok":
+            continue
+        for measure_name in ("seconds", "peak_rss"):
+            if result[measure_name] > before[measure_name] * (1 + tolerance):
+                regressions.append(
+                    {
+                        "report": result["report"],
+                        "scale": _key(result)[2:],
+                        "measure": measure_name,
+                        "before": before[measure_name],
+                        "after": result[measure_name],
+                    }
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", help="database url, DATABASE_URL / PG* by default")
+    parser.add_argument(
+        "--scales",
+        type=lambda v: [parse_scale(s) for s in v.split(",")],
+        default=[parse_scale("10:10:30"), parse_scale("100:100:365")],
+        help="comma separated recipes:ingredients:dates",
+    )
+    parser.add_argument("--reports", type=lambda v: v.split(","), default=list(REPORTS))
+    parser.add_argument("--per-recipe", type=int, default=5)
+    parser.add_argument("--density", type=float, default=0.1)
+    parser.add_argument("--max-rows", type=int, default=5_000_000)
+    parser.add_argument("--timeout", type=int, default=600, help="seconds per report")
+    parser.add_argument(
+        "--summary", action="store_true", help="refresh and read executedrecipe_daily"
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="a previous --json file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--measure", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        report, scale = args.measure
+        print(json.dumps(measure(args.url, report, json.loads(scale))))
+        return
+
+    results = run_benchmark(
+        args.url,
+        args.scales,
+        args.reports,
+        args.per_recipe,
+        args.density,
+        args.max_rows,
+        args.summary,
+        args.timeout,
+    )
+
+    print(
+        f"{'report':<38}{'scale':>18}{'status':>9}{'rows':>11}"
+        f"{'ms':>10}{'peak MiB':>10}{'cost':>12}"
+    )
+    for r in results:
+        scale = f"{r['recipes']}:{r['ingredients']}:{r['dates']}"
+        if r["status"] != "ok":
+            print(f"{r['report']:<38}{scale:>18}{r['status']:>9}")
+            continue
+        cost = "" if r["cost"] is None else f"{r['cost']:.0f}"
+        print(
+            f"{r['report']:<38}{scale:>18}{r['status']:>9}{r['rows']:>11}"
+            f"{r['seconds'] * 1000:>10.1f}{r['peak_rss'] / 2 ** 20:>10.1f}{cost:>12}"
+        )
+
+    output = {"meta": metadata(_engine(args.url)), "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for r in regressions:
+            print(
+                f"REGRESSION {r['report']} {r['scale']} {r['measure']}: "
+                f"{r['before']:.4g} -> {r['after']:.4g}"
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
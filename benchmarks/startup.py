@@ -0,0 +1,74 @@
+"""
+Startup benchmark - time taken to import each module in a fresh interpreter.
+
+Importing a module should only define things, no engine, no schema, no
+queries. Run from the repository root:
+
+    python -m benchmarks.startup [--repeat 5]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "engine",
+    "orm.models",
+    "orm.intro",
+    "orm.querying_basics",
+    "orm.queries.cross_join",
+    "core.metadata_basics",
+    "core.querying_basics",
+]
+
+TIMER = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def time_import(module, repeat=5):
+    """
+    Import the module `repeat` times, each in a new interpreter, returning the
+    timings in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", TIMER.format(module=module)],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def run_benchmark(modules=MODULES, repeat=5):
+    results = {}
+    for module in modules:
+        timings = time_import(module, repeat)
+        results[module] = {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "max": max(timings),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    print(f"{'module':<28}{'min ms':>10}{'median ms':>12}{'max ms':>10}")
+    for module, result in run_benchmark(args.modules, args.repeat).items():
+        print(
+            f"{module:<28}{result['min'] * 1000:>10.1f}"
+            f"{result['median'] * 1000:>12.1f}{result['max'] * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
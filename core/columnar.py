@@ -0,0 +1,290 @@
+"""
+Columnar fetch
+pd.DataFrame(result) has SQLAlchemy build a row object per result row, runs
+each value through its type's result processor and then pandas takes the rows
+apart again into columns. Here results are read straight from the DBAPI cursor
+(or from COPY) and decoded a column at a time:
+
+- numpy   fetchmany() batches of raw DBAPI tuples, transposed once and
+          converted per column by the column's type - Date to datetime64[D]
+          (sqlite's date strings are parsed in bulk), Float / Numeric to
+          float64, Integer to int64 (float64 with NaN when there are NULLs),
+          String and anything else to object arrays
+- arrow   pyarrow record batches. On postgresql COPY (query) TO STDOUT as
+          csv parsed by pyarrow's streaming csv reader with a type per column,
+          no python object is made per value at all. Elsewhere the numpy
+          batches converted
+
+Statements are Core selects or ORM queries, bind an Engine, Connection or
+Session. Batches stream with at most batch_size rows each:
+
+    q = full_cross_join_on_two_variables_query(session)
+    for batch in arrow_batches(session, q):
+        ...
+    df = fetch_frame(session, q)                    # pandas
+    df = polars.from_arrow(fetch_arrow(engine, stmt))
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import types
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+KINDS = [
+    (types.DateTime, "datetime"),
+    (types.Date, "date"),
+    (types.Integer, "integer"),
+    (types.Numeric, "float"),
+    (types.String, "string"),
+]
+
+
+def column_kind(type_):
+    for type_class, kind in KINDS:
+        if isinstance(type_, type_class):
+            return kind
+    return "object"
+
+
+@contextmanager
+def _connection(bind):
+    if isinstance(bind, Session):
+        yield bind.connection()
+    elif isinstance(bind, Engine):
+        with bind.connect() as connection:
+            yield connection
+    else:
+        yield bind
+
+
+def _statement(stmt):
+    # an ORM query
+    return getattr(stmt, "statement", stmt)
+
+
+def result_columns(dialect, stmt):
+    """
+    (name, kind) of each column stmt returns.
+    """
+    compiled = _statement(stmt).compile(dialect=dialect)
+    return [(column[0], column_kind(column[3])) for column in compiled._result_columns]
+
+
+# region numpy
+
+
+def decode_column(values, kind):
+    """
+    A numpy array of a column's raw DBAPI values.
+    """
+    import numpy as np
+
+    if kind == "date":
+        return np.array(values, dtype="datetime64[D]")
+    if kind == "datetime":
+        return np.array(values, dtype="datetime64[us]")
+    if kind == "float":
+        # None becomes NaN
+        return np.array(values, dtype=np.float64)
+    if kind == "integer":
+        try:
+            return np.array(values, dtype=np.int64)
+        except TypeError:
+            return np.array(values, dtype=np.float64)
+    return np.array(values, dtype=object)
+
+
+def numpy_batches(bind, stmt, batch_size=65536):
+    """
+    Yield dicts of column name to numpy array, at most batch_size rows each.
+    """
+    with _connection(bind) as connection:
+        result = connection.execution_options(stream_results=True).execute(
+            _statement(stmt)
+        )
+        try:
+            names = result.keys()
+            kinds = [
+                column_kind(column[3])
+                for column in result.context.compiled._result_columns
+            ]
+            cursor = result.cursor
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield {
+                    name: decode_column(values, kind)
+                    for name, kind, values in zip(names, kinds, zip(*rows))
+                }
+        finally:
+            result.close()
+
+
+def fetch_numpy(bind, stmt, batch_size=65536):
+    """
+    Every row of stmt as a dict of column name to numpy array.
+    """
+    import numpy as np
+
+    with _connection(bind) as connection:
+        batches = list(numpy_batches(connection, stmt, batch_size))
+        if not batches:
+            return {
+                name: decode_column([], kind)
+                for name, kind in result_columns(connection.dialect, stmt)
+            }
+    return {name: np.concatenate([b[name] for b in batches]) for name in batches[0]}
+
+
+# endregion
+
+# region arrow
+
+
+def _arrow_type(kind):
+    import pyarrow as pa
+
+    return {
+        "date": pa.date32(),
+        "datetime": pa.timestamp("us"),
+        "integer": pa.int64(),
+        "float": pa.float64(),
+    }.get(kind, pa.string())
+
+
+def _copy_sql(connection, stmt):
+    """
+    COPY (stmt) TO STDOUT as csv with the parameters inlined by psycopg2,
+    and the result column names and kinds.
+    """
+    compiled = _statement(stmt).compile(dialect=connection.dialect)
+    params = dict(compiled.params)
+    sql = compiled.string
+    for name, bind in compiled.binds.items():
+        if bind.expanding:
+            values = tuple(params.pop(name))
+            placeholder = f"%({name})s" if values else "(SELECT NULL WHERE false)"
+            sql = sql.replace(f"([EXPANDING_{name}])", placeholder)
+            if values:
+                params[name] = values
+    cursor = connection.connection.cursor()
+    try:
+        query = cursor.mogrify(sql, params).decode()
+    finally:
+        cursor.close()
+    names = [column[0] for column in compiled._result_columns]
+    kinds = [column_kind(column[3]) for column in compiled._result_columns]
+    return f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", names, kinds
+
+
+def _copy_batches(connection, stmt, batch_size):
+    import pyarrow as pa
+    from pyarrow import csv
+
+    sql, names, kinds = _copy_sql(connection, stmt)
+    read_fd, write_fd = os.pipe()
+    reader = os.fdopen(read_fd, "rb")
+    writer = os.fdopen(write_fd, "wb")
+    raw = connection.connection
+    failure = []
+
+    def copy():
+        cursor = raw.cursor()
+        try:
+            cursor.copy_expert(sql, writer)
+        except Exception as error:
+            failure.append(error)
+        finally:
+            cursor.close()
+            writer.close()
+
+    thread = threading.Thread(target=copy, daemon=True)
+    thread.start()
+    try:
+        # no output is no rows, or a COPY which failed before writing any -
+        # either way there is nothing to parse (an empty csv is an error to
+        # pyarrow), a failure is raised below
+        if reader.peek(1):
+            batches = csv.open_csv(
+                reader,
+                read_options=csv.ReadOptions(
+                    column_names=names, block_size=max(batch_size * 64, 1 << 20)
+                ),
+                # a NULL in a one column result is an empty line
+                parse_options=csv.ParseOptions(ignore_empty_lines=False),
+                convert_options=csv.ConvertOptions(
+                    column_types={n: _arrow_type(k) for n, k in zip(names, kinds)},
+                    # COPY writes NULL unquoted and empty strings quoted
+                    null_values=[""],
+                    strings_can_be_null=True,
+                    quoted_strings_can_be_null=False,
+                ),
+            )
+            for batch in batches:
+                for offset in range(0, batch.num_rows, batch_size):
+                    yield batch.slice(offset, batch_size)
+    except pa.ArrowInvalid:
+        if failure:
+            raise failure[0]
+        raise
+    finally:
+        if thread.is_alive():
+            # stopped early, stop the COPY rather than wait for it
+            raw.cancel()
+        reader.close()
+        thread.join()
+    if failure:
+        raise failure[0]
+
+
+def arrow_batches(bind, stmt, batch_size=65536):
+    """
+    Yield pyarrow RecordBatches of at most batch_size rows. Closing the
+    generator early cancels a COPY, roll back before using the connection
+    again.
+    """
+    import pyarrow as pa
+
+    with _connection(bind) as connection:
+        if connection.dialect.name == "postgresql":
+            yield from _copy_batches(connection, stmt, batch_size)
+            return
+        for columns in numpy_batches(connection, stmt, batch_size):
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(values) for values in columns.values()],
+                names=list(columns),
+            )
+
+
+def fetch_arrow(bind, stmt, batch_size=65536):
+    """
+    Every row of stmt as a pyarrow Table.
+    """
+    import pyarrow as pa
+
+    with _connection(bind) as connection:
+        batches = list(arrow_batches(connection, stmt, batch_size))
+        if not batches:
+            columns = result_columns(connection.dialect, stmt)
+            return pa.schema([(n, _arrow_type(k)) for n, k in columns]).empty_table()
+    return pa.Table.from_batches(batches)
+
+
+# endregion
+
+
+def fetch_frame(bind, stmt, batch_size=65536):
+    """
+    Every row of stmt as a pandas DataFrame, via arrow when pyarrow is
+    installed.
+    """
+    import pandas as pd
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return pd.DataFrame(fetch_numpy(bind, stmt, batch_size))
+    return fetch_arrow(bind, stmt, batch_size).to_pandas(date_as_object=False)
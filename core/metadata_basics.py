@@ -13,7 +13,7 @@ In terms of data structures
 Generate to a schema.
 Generate from a schema.
 """
-from engine import engine
+from engine import get_engine
 
 from sqlalchemy import MetaData
 from sqlalchemy import Table, Column
@@ -23,6 +23,7 @@ from sqlalchemy import inspect
 
 
 def run_example():
+    engine = get_engine()
     """
     +-------------------------------------------------------------------------+
     | Creating tables using 'metadata'
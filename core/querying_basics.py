@@ -1,12 +1,15 @@
-from engine import engine
+from engine import get_engine
 from sqlalchemy import MetaData
 from sqlalchemy import Table, Column
 from sqlalchemy import Integer, String, DateTime
 from sqlalchemy import ForeignKey
 from sqlalchemy import select, join
 
+from core.streaming import stream_batches
+
 
 def run_example():
+    engine = get_engine()
     metadata = MetaData()
     user_table = Table(
         "example_user",
@@ -93,6 +96,15 @@ def run_example():
     results = rc.fetchall()
     print(results)
 
+    """
+    +-------------------------------------------------------------------------+
+    | Streaming select - large results are fetched in batches through a
+    | server side cursor rather than all at once with fetchall().
+    +-------------------------------------------------------------------------+
+    """
+    for rows in stream_batches(engine, stmt, batch_size=1):
+        print(rows)
+
     """
     +-------------------------------------------------------------------------+
     | Subquery
@@ -0,0 +1,41 @@
+"""
+Streaming results
+fetchall() materialises every row of a result in memory. With
+stream_results=True the DBAPI uses a server side (named) cursor instead and
+rows are pulled from the database batch_size at a time with fetchmany(), so
+memory stays flat regardless of how many rows the statement returns.
+"""
+from sqlalchemy.engine import Engine
+
+
+def stream_batches(bind, stmt, batch_size=10000):
+    """
+    Execute stmt and yield lists of at most batch_size rows.
+
+    bind is an Engine or Connection, an Engine gets a connection of its own
+    which is released when the generator is exhausted or closed.
+    """
+    if isinstance(bind, Engine):
+        with bind.connect() as connection:
+            yield from stream_batches(connection, stmt, batch_size)
+        return
+
+    result = bind.execution_options(stream_results=True).execute(stmt)
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        result.close()
+
+
+def stream_frames(bind, stmt, batch_size=10000):
+    """
+    As stream_batches() but yield a pandas DataFrame per batch.
+    """
+    import pandas as pd
+
+    for rows in stream_batches(bind, stmt, batch_size):
+        yield pd.DataFrame.from_records(rows, columns=rows[0].keys())
@@ -9,17 +9,221 @@ We control the span of a connection in use.
 Engine usually uses a connection pool.
 
 SQL sent to engine.execute() as a string is not modified, is consumed by the DBAPI verbatim.
+
+The engine is built lazily by get_engine() on first use, configured from the
+environment:
+
+    DATABASE_URL            full url, overrides the PG* variables below
+    PGUSER / PGPASSWORD     credentials (postgres / postgres)
+    PGHOST / PGPORT         server (localhost / 5432)
+    PGDATABASE              database name (test)
+    DB_POOL_SIZE            connections kept open in the pool (5)
+    DB_MAX_OVERFLOW         connections allowed above pool size (10)
+    DB_POOL_TIMEOUT         seconds to wait for a connection (30)
+    DB_POOL_PRE_PING        test connections on checkout (1)
+    DB_POOL_RECYCLE         seconds before a connection is replaced (-1, never)
+    DB_STATEMENT_TIMEOUT_MS postgres statement_timeout, 0 disables (0)
+    DB_ECHO                 log every statement (0)
+    DB_METRICS              record statement metrics, see metrics.py (1)
+    DB_SLOW_QUERY_MS        slow query log threshold, 0 disables (500)
+    DB_EXPLAIN_SLOW         log EXPLAIN (ANALYZE, BUFFERS) of slow SELECTs (0)
+    DB_EXECUTEMANY_MODE     psycopg2 executemany_mode, "values" sends pages of
+                            multi-row INSERTs instead of one per row (values)
+
+Prefer the metrics and slow query log over DB_ECHO, echo formats and logs
+every statement and its parameters.
 """
 import os
+import time
+import threading
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+import metrics
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+def _env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+def engine_config():
+    """
+    Read the engine settings from the environment.
+    """
+    pg_user = os.getenv("PGUSER", "postgres")
+    host = os.getenv("PGHOST", "localhost")
+    port = os.getenv("PGPORT", "5432")
+    pg_pass = os.getenv("PGPASSWORD", "postgres")
+    db_name = os.getenv("PGDATABASE", "test")
+    return {
+        "url": os.getenv(
+            "DATABASE_URL",
+            f"postgresql://{pg_user}:{pg_pass}@{host}:{port}/{db_name}",
+        ),
+        "pool_size": _env_int("DB_POOL_SIZE", 5),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", -1),
+        "statement_timeout_ms": _env_int("DB_STATEMENT_TIMEOUT_MS", 0),
+        "echo": _env_bool("DB_ECHO", False),
+        "metrics": _env_bool("DB_METRICS", True),
+        "slow_query_ms": _env_int("DB_SLOW_QUERY_MS", 500),
+        "explain_slow": _env_bool("DB_EXPLAIN_SLOW", False),
+        "executemany_mode": os.getenv("DB_EXECUTEMANY_MODE", "values"),
+    }
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool which records how long callers wait for a connection.
+    on_wait, when set, is called with each wait in seconds.
+    """
+
+    on_wait = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+            if self.on_wait is not None:
+                self.on_wait(waited)
+
+    def recreate(self):
+        # carry the counters over when the engine is disposed
+        pool = super().recreate()
+        pool.checkouts = self.checkouts
+        pool.wait_time_total = self.wait_time_total
+        pool.wait_time_max = self.wait_time_max
+        pool.on_wait = self.on_wait
+        return pool
+
+
+def build_engine(**overrides):
+    """
+    Create a new engine from engine_config(), any keyword overrides the
+    corresponding environment setting.
+    """
+    config = engine_config()
+    config.update(overrides)
+
+    url = make_url(config.pop("url"))
+    statement_timeout_ms = config.pop("statement_timeout_ms")
+    kwargs = {"echo": config.pop("echo")}
+    record_metrics = config.pop("metrics")
+    slow_query_ms = config.pop("slow_query_ms")
+    explain_slow = config.pop("explain_slow")
+    executemany_mode = config.pop("executemany_mode")
+
+    if url.get_backend_name() == "postgresql" and statement_timeout_ms:
+        kwargs["connect_args"] = {
+            "options": f"-c statement_timeout={statement_timeout_ms}"
+        }
+    if url.get_backend_name() == "postgresql" and url.get_driver_name() == "psycopg2":
+        # the unit of work flushes rows with known primary keys, and
+        # bulk_insert(method="executemany"), as one executemany
+        kwargs["executemany_mode"] = executemany_mode
+    if url.get_backend_name() != "sqlite":
+        # sqlite uses its own single threaded pools
+        kwargs["poolclass"] = TimedQueuePool
+        kwargs.update(config)
+
+    engine = create_engine(url, **kwargs)
+    if record_metrics:
+        metrics.install(engine, slow_query_ms=slow_query_ms, explain=explain_slow)
+    return engine
+
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Return the process wide engine, creating it on first use.
+
+    A forked worker gets its own engine, connections are never shared
+    across processes.
+    """
+    global _engine, _engine_pid
+    pid = os.getpid()
+    if _engine is None or _engine_pid != pid:
+        with _engine_lock:
+            if _engine is None or _engine_pid != pid:
+                _engine = build_engine()
+                _engine_pid = pid
+    return _engine
+
+
+def reset_engine():
+    """
+    Dispose of the current engine, the next get_engine() builds a fresh one.
+    """
+    global _engine, _engine_pid
+    with _engine_lock:
+        if _engine is not None and _engine_pid == os.getpid():
+            _engine.dispose()
+        _engine = None
+        _engine_pid = None
+
+
+def pool_stats(engine=None):
+    """
+    Per process connection pool statistics, for sizing the pool.
+    """
+    engine = engine or get_engine()
+    pool = engine.pool
+    stats = {"pid": os.getpid(), "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            {
+                "pool_size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            }
+        )
+    if isinstance(pool, TimedQueuePool):
+        stats.update(
+            {
+                "checkouts": pool.checkouts,
+                "wait_time_total": pool.wait_time_total,
+                "wait_time_avg": pool.wait_time_total / pool.checkouts
+                if pool.checkouts
+                else 0.0,
+                "wait_time_max": pool.wait_time_max,
+            }
+        )
+    return stats
+
+
+def __getattr__(name):
+    # `from engine import engine` keeps working, the engine is built on first
+    # reference rather than when this module is imported
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-pg_user = os.getenv("PGUSER", "postgres")
-host = os.getenv("PGHOST", "localhost")
-pg_pass = os.getenv("PGPASSWORD", "postgres")
-db_name = "test"
-engine = create_engine(
-    f"postgresql://{pg_user}:{pg_pass}@{host}:5432/{db_name}", echo=True
-)
 
 """
 +-------------------------------------------------------------------------+
@@ -27,6 +231,7 @@ engine = create_engine(
 +-------------------------------------------------------------------------+
 """
 if __name__ == "__main__":
+    engine = get_engine()
     engine.execute(
         "CREATE TABLE employee( id int not null, name varchar(40) not null);"
     )
@@ -37,3 +242,5 @@ if __name__ == "__main__":
         print(r)
     result_cursor.close()
     engine.execute("DROP TABLE employee")
+    print(pool_stats(engine))
+    print(metrics.render_prometheus())
@@ -0,0 +1,417 @@
+"""
+Statement metrics
+
+Engine events in place of echo=True. For every statement shape (the SQL with
+parameters as placeholders and IN lists collapsed, see fingerprint()) records
+
+- a latency histogram of cursor execution time
+- the rows returned or affected, as the DBAPI reports them
+- errors
+
+plus a histogram of the time spent waiting on the connection pool, and the
+hits, misses, evictions and size of the caches registered with
+register_cache() (orm.queries.statement_cache registers its report_cache as
+"report"). Statements slower than slow_query_ms are logged as one JSON
+object per line on the "metrics.slow" logger, with explain=True a SELECT on
+PostgreSQL is re-run under EXPLAIN (ANALYZE, BUFFERS) and the plan logged
+with it.
+
+build_engine() installs the process wide registry from the environment:
+
+    DB_METRICS              record statement metrics (1)
+    DB_SLOW_QUERY_MS        slow query log threshold, 0 disables (500)
+    DB_EXPLAIN_SLOW         log EXPLAIN (ANALYZE, BUFFERS) of slow SELECTs (0)
+
+and the registry is exported in the Prometheus text format:
+
+    write_prometheus("/var/lib/node_exporter/textfile/sqlalchemy.prom")
+    serve_prometheus(port=9464)     # http://127.0.0.1:9464/metrics
+
+Series are labelled with the statement id (a hash of the shape) only - the
+SQL would put literals and user data in label values and a new series for
+every distinct text. summary() and the slow query log map ids back to
+statements. The registry keeps the DB_METRICS_MAX_STATEMENTS (1000) most
+recently seen shapes, the least recently seen are dropped beyond that.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+slow_logger = logging.getLogger("metrics.slow")
+
+_IN_LIST = re.compile(r"\bIN \([^()]*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+# prometheus client defaults with two finer buckets for sub millisecond
+# statements
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+MAX_STATEMENTS = 1000
+
+
+def fingerprint(statement):
+    """
+    The shape of a statement - whitespace normalised, IN lists collapsed.
+    """
+    statement = _WHITESPACE.sub(" ", statement.strip())
+    return _IN_LIST.sub("IN (...)", statement)
+
+
+def statement_id(shape):
+    return hashlib.sha1(shape.encode()).hexdigest()[:12]
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        (upper bound, observations <= bound) pairs ending with +Inf.
+        """
+        total = 0
+        bounds = [str(b) for b in self.buckets] + ["+Inf"]
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            yield bound, total
+
+
+class StatementStats:
+    def __init__(self, shape):
+        self.shape = shape
+        self.id = statement_id(shape)
+        self.latency = Histogram()
+        self.rows = 0
+        self.errors = 0
+        self.slow = 0
+
+
+class Metrics:
+    """
+    Thread safe registry of statement and pool wait metrics, keeping the
+    max_statements most recently seen statement shapes.
+    """
+
+    def __init__(self, max_statements=MAX_STATEMENTS):
+        self._lock = threading.Lock()
+        self.max_statements = max_statements
+        self.statements = OrderedDict()
+        self.evicted = 0
+        self.pool_wait = Histogram()
+        self.caches = {}
+
+    def register_cache(self, name, cache):
+        """
+        Export cache.stats() - hits, misses, evictions and size - labelled
+        cache=name.
+        """
+        with self._lock:
+            self.caches[name] = cache
+
+    def _stats(self, shape):
+        stats = self.statements.get(shape)
+        if stats is None:
+            stats = self.statements[shape] = StatementStats(shape)
+            while len(self.statements) > self.max_statements:
+                self.statements.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.statements.move_to_end(shape)
+        return stats
+
+    def observe_statement(self, shape, seconds, rows, slow=False):
+        with self._lock:
+            stats = self._stats(shape)
+            stats.latency.observe(seconds)
+            if rows > 0:
+                stats.rows += rows
+            if slow:
+                stats.slow += 1
+
+    def observe_error(self, shape):
+        with self._lock:
+            self._stats(shape).errors += 1
+
+    def observe_pool_wait(self, seconds):
+        with self._lock:
+            self.pool_wait.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.statements = OrderedDict()
+            self.evicted = 0
+            self.pool_wait = Histogram()
+
+    def summary(self, limit=10):
+        """
+        The limit statement shapes with the most total time, slowest first.
+        """
+        with self._lock:
+            stats = sorted(
+                self.statements.values(), key=lambda s: s.latency.sum, reverse=True
+            )
+            return [
+                {
+                    "id": s.id,
+                    "statement": s.shape,
+                    "calls": s.latency.count,
+                    "seconds": s.latency.sum,
+                    "mean_ms": s.latency.sum / s.latency.count * 1000
+                    if s.latency.count
+                    else 0.0,
+                    "rows": s.rows,
+                    "errors": s.errors,
+                    "slow": s.slow,
+                }
+                for s in stats[:limit]
+            ]
+
+    # region prometheus
+
+    def render_prometheus(self):
+        """
+        The registry in the Prometheus text exposition format. Statements are
+        labelled with their short hash id.
+        """
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name, labels, hist):
+            sep = "," if labels else ""
+            for bound, count in hist.cumulative():
+                lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}')
+            braced = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}_sum{braced} {hist.sum}")
+            lines.append(f"{name}_count{braced} {hist.count}")
+
+        with self._lock:
+            stats = list(self.statements.values())
+            labels = {s.shape: f'id="{s.id}"' for s in stats}
+
+            header(
+                "db_statement_duration_seconds",
+                "histogram",
+                "Cursor execution time per statement shape.",
+            )
+            for s in stats:
+                histogram("db_statement_duration_seconds", labels[s.shape], s.latency)
+
+            for name, attribute, help_text in (
+                ("db_statement_rows_total", "rows", "Rows returned or affected."),
+                ("db_statement_errors_total", "errors", "Statements which raised."),
+                ("db_statement_slow_total", "slow", "Statements over the slow threshold."),
+            ):
+                header(name, "counter", help_text)
+                for s in stats:
+                    lines.append(f"{name}{{{labels[s.shape]}}} {getattr(s, attribute)}")
+
+            header(
+                "db_statements_evicted_total",
+                "counter",
+                "Statement shapes dropped from the registry, least recently seen.",
+            )
+            lines.append(f"db_statements_evicted_total {self.evicted}")
+
+            header(
+                "db_pool_wait_seconds",
+                "histogram",
+                "Time spent waiting for a pooled connection.",
+            )
+            histogram("db_pool_wait_seconds", "", self.pool_wait)
+            caches = list(self.caches.items())
+
+        cache_stats = [(name, cache.stats()) for name, cache in caches]
+        for name, kind, key, help_text in (
+            ("db_cache_hits_total", "counter", "hits", "Lookups found in the cache."),
+            ("db_cache_misses_total", "counter", "misses", "Lookups not found."),
+            ("db_cache_evictions_total", "counter", "evictions", "Entries evicted."),
+            ("db_cache_size", "gauge", "size", "Entries held."),
+        ):
+            header(name, kind, help_text)
+            for cache, stats in cache_stats:
+                lines.append(f'{name}{{cache="{cache}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Atomically write the registry to path, for the node_exporter textfile
+        collector or anything else scraping files.
+        """
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp, path)
+
+    def serve_prometheus(self, port=9464, host="127.0.0.1"):
+        """
+        Serve the registry on http://host:port/metrics from a daemon thread.
+        Returns the server, shutdown() stops it.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+    # endregion
+
+
+registry = Metrics(int(os.getenv("DB_METRICS_MAX_STATEMENTS", MAX_STATEMENTS)))
+
+
+# region engine events
+
+
+def _explain(conn, statement, parameters):
+    """
+    EXPLAIN (ANALYZE, BUFFERS) statement on conn's DBAPI connection, inside
+    a savepoint so a failure leaves the caller's transaction usable.
+    """
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT metrics_explain")
+        try:
+            cursor.execute(
+                f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", parameters
+            )
+            plan = cursor.fetchone()[0]
+        finally:
+            cursor.execute("ROLLBACK TO SAVEPOINT metrics_explain")
+        return plan
+    finally:
+        cursor.close()
+
+
+class _StatementListener:
+    def __init__(self, metrics, slow_query_ms, explain):
+        self.metrics = metrics
+        self.slow_seconds = slow_query_ms / 1000 if slow_query_ms else None
+        self.explain = explain
+
+    def before_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):
+        seconds = time.perf_counter() - conn.info["metrics_start"].pop()
+        shape = fingerprint(statement)
+        slow = self.slow_seconds is not None and seconds >= self.slow_seconds
+        self.metrics.observe_statement(shape, seconds, cursor.rowcount, slow)
+        if slow:
+            self.log_slow(conn, shape, statement, parameters, executemany, seconds)
+
+    def handle_error(self, context):
+        if context.connection is not None:
+            starts = context.connection.info.get("metrics_start")
+            if starts:
+                starts.pop()
+        if context.statement is not None:
+            self.metrics.observe_error(fingerprint(context.statement))
+
+    def log_slow(self, conn, shape, statement, parameters, executemany, seconds):
+        record = {
+            "event": "slow_query",
+            "id": statement_id(shape),
+            "statement": shape,
+            "ms": round(seconds * 1000, 3),
+            "threshold_ms": self.slow_seconds * 1000,
+        }
+        explainable = (
+            self.explain
+            and not executemany
+            and conn.dialect.name == "postgresql"
+            and shape.upper().startswith(("SELECT", "WITH"))
+        )
+        if explainable:
+            try:
+                record["plan"] = _explain(conn, statement, parameters)
+            except Exception as error:
+                record["explain_error"] = str(error)
+        slow_logger.warning(json.dumps(record, default=str))
+
+
+def install(engine, metrics=None, slow_query_ms=500, explain=False):
+    """
+    Record statement metrics for engine into metrics (the process wide
+    registry by default). Idempotent, a second call replaces the settings.
+    """
+    metrics = metrics if metrics is not None else registry
+    uninstall(engine)
+    listener = _StatementListener(metrics, slow_query_ms, explain)
+    event.listen(engine, "before_cursor_execute", listener.before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", listener.after_cursor_execute)
+    event.listen(engine, "handle_error", listener.handle_error)
+    engine._metrics_listener = listener
+    # TimedQueuePool reports each checkout wait, see engine.py
+    engine.pool.on_wait = metrics.observe_pool_wait
+    return metrics
+
+
+def uninstall(engine):
+    listener = getattr(engine, "_metrics_listener", None)
+    if listener is None:
+        return
+    del engine._metrics_listener
+    event.remove(engine, "before_cursor_execute", listener.before_cursor_execute)
+    event.remove(engine, "after_cursor_execute", listener.after_cursor_execute)
+    event.remove(engine, "handle_error", listener.handle_error)
+    engine.pool.on_wait = None
+
+
+# endregion
+
+
+def register_cache(name, cache):
+    registry.register_cache(name, cache)
+
+
+def render_prometheus():
+    return registry.render_prometheus()
+
+
+def write_prometheus(path):
+    registry.write_prometheus(path)
+
+
+def serve_prometheus(port=9464, host="127.0.0.1"):
+    return registry.serve_prometheus(port, host)
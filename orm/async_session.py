@@ -0,0 +1,85 @@
+"""
+AsyncSession
+
+The query helpers and reports build Query objects on a Session. An
+AsyncSession hands out a Session bound to a compile only engine for building
+them and awaits their execution on an AsyncEngine:
+
+    session = AsyncSession(engine)
+    q = session.query(Recipe.recipe_name).order_by(Recipe.recipe_name)
+    names = await session.all(q)
+
+There is no identity map or unit of work, results are rows (asyncpg Records)
+rather than mapped objects - use it for column queries and the reports. Each
+call checks out its own connection unless one is passed, so independent
+queries can be gathered:
+
+    recipes, facts = await asyncio.gather(session.all(q1), session.all(q2))
+
+The query builders don't execute. prepare() checks whether the daily summary
+is fresh into session.summary_fresh, the reports pass it on as use_summary.
+Until then they read the raw executedrecipe rows.
+"""
+import asyncio
+
+from sqlalchemy.orm import Session
+
+from async_engine import compile_engine
+from orm.models import DirtyDate, SummaryRefresh
+from orm.summary import SUMMARY_NAME
+
+
+class AsyncSession:
+    def __init__(self, engine):
+        self.engine = engine
+        self.sync_session = Session(bind=compile_engine)
+        # the raw rows are always right, prepare() checks the summary
+        self.summary_fresh = False
+
+    @property
+    def info(self):
+        return self.sync_session.info
+
+    def query(self, *entities, **kwargs):
+        return self.sync_session.query(*entities, **kwargs)
+
+    async def prepare(self):
+        """
+        Record whether the daily summary is fresh, for the reports which read
+        from it when it is (orm.summary.executed_quantities_query()).
+        """
+        refreshed = self.query(SummaryRefresh.name).filter(
+            SummaryRefresh.name == SUMMARY_NAME
+        )
+        dirty = self.query(DirtyDate.date).limit(1)
+        refreshed, dirty = await asyncio.gather(
+            self.engine.fetch_one(refreshed), self.engine.fetch_one(dirty)
+        )
+        self.summary_fresh = refreshed is not None and dirty is None
+
+    async def all(self, query, connection=None):
+        return await self.engine.fetch_all(query, connection)
+
+    async def first(self, query, connection=None):
+        return await self.engine.fetch_one(query.limit(1), connection)
+
+    async def scalar(self, query, connection=None):
+        return await self.engine.scalar(query, connection)
+
+    def stream(self, query, batch_size=10000):
+        """
+        Async generator of lists of at most batch_size rows, see
+        orm/streaming.py.
+        """
+        return self.engine.stream(query, batch_size)
+
+    async def frame(self, query):
+        """
+        A pandas DataFrame of a column query.
+        """
+        import pandas as pd
+
+        columns = [description["name"] for description in query.column_descriptions]
+        return pd.DataFrame.from_records(
+            [tuple(row) for row in await self.all(query)], columns=columns
+        )
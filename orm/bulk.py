@@ -0,0 +1,598 @@
+"""
+Bulk loading and set based changes
+session.add_all() goes through the unit of work one object at a time, and for
+autoincrement primary keys fetches the id of each row as it is inserted.
+
+bulk_insert() skips the ORM and writes plain rows in large batches using one of
+
+- executemany - one INSERT statement, the DBAPI executes it per parameter set
+                (psycopg2 as pages of multi-row INSERTs, see DB_EXECUTEMANY_MODE)
+- values      - one multi-row INSERT ... VALUES (...), (...) per batch
+- copy        - PostgreSQL COPY ... FROM STDIN, fastest by a wide margin
+
+Rows can be dicts, tuples (in the order of `columns`, by default every column
+but an autoincrement primary key) or a pandas DataFrame, whose NaN / NaT are
+written as NULL. A values batch is capped to the database's limit of bound
+parameters per statement (MAX_PARAMETERS).
+
+Changing or removing rows through the session loads each object and flushes
+an UPDATE / DELETE per object. The set based equivalents never load any:
+
+- bulk_update  UPDATE ... FROM (VALUES ...) joined on a key, a statement per
+               batch of keyed rows (postgresql, executemany elsewhere)
+- bulk_delete  DELETE ... USING the other tables the criteria join to
+               (postgresql, WHERE pk IN (SELECT ...) elsewhere)
+- truncate     TRUNCATE the models' tables (postgresql, DELETE elsewhere)
+
+With a Session they keep the objects it already holds in step, as
+Query.update / delete do, by synchronize_session:
+
+- "none"      nothing, the objects may be stale
+- "evaluate"  apply the change in python - set the new values, remove the
+              deleted objects (the criteria must be evaluable on one model)
+- "fetch"     find the affected rows in the database, expire the updated
+              objects so they reload and remove the deleted ones
+"""
+import io
+import time
+from itertools import islice
+
+from sqlalchemy import and_, bindparam, cast, func, inspect, select, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.evaluator import EvaluatorCompiler, UnevaluatableError
+from sqlalchemy.sql.expression import ClauseElement, Executable, FromClause
+
+from orm.models import Base, ExecutedRecipe, DailyQuantity, DirtyDate
+
+METHODS = ("executemany", "values", "copy")
+
+# bound parameters per statement: sqlite before 3.32 allows 999, mssql 2100,
+# the postgresql protocol (asyncpg) 32767
+MAX_PARAMETERS = {"sqlite": 32766, "mssql": 2100, "postgresql": 32767}
+SYNCHRONIZE = ("none", "evaluate", "fetch")
+
+# TRUNCATE doesn't fire the change tracking triggers, so the tables they
+# maintain are truncated along with executedrecipe
+TRUNCATED_WITH = {
+    ExecutedRecipe.__table__: [DailyQuantity.__table__, DirtyDate.__table__],
+}
+
+
+def default_columns(model):
+    """
+    Columns of the model's table, leaving out its autoincrement column. The
+    other primary key columns, such as the partition key of a partitioned
+    table's primary key, are values to insert.
+    """
+    table = model.__table__
+    return [
+        column.name
+        for column in table.columns
+        if column is not table._autoincrement_column
+    ]
+
+
+def _primary_key(model):
+    """
+    The mapper's primary key columns, which identify the model's objects. A
+    partitioned table's primary key also holds the partition key.
+    """
+    return list(inspect(model).primary_key)
+
+
+def _connection(bind):
+    if isinstance(bind, Session):
+        return bind.connection()
+    return bind
+
+
+def max_batch_size(connection, width, batch_size):
+    """
+    batch_size capped so a statement of rows width parameters each stays
+    within the database's parameter limit.
+    """
+    dialect = connection.dialect
+    limit = MAX_PARAMETERS.get(dialect.name)
+    if dialect.name == "sqlite":
+        version = getattr(dialect.dbapi, "sqlite_version_info", (3, 32))
+        if version < (3, 32):
+            limit = 999
+    if limit is None or not width:
+        return batch_size
+    return max(1, min(batch_size, limit // width))
+
+
+def _batches(rows, columns, batch_size):
+    """
+    Yield lists of dicts of at most batch_size rows.
+    """
+    if hasattr(rows, "to_dict") and hasattr(rows, "iloc"):
+        # DataFrame - to_dict boxes numpy scalars into python types, NaN and
+        # NaT become None (an object frame, a float column would keep NaN)
+        for start in range(0, len(rows), batch_size):
+            frame = rows.iloc[start : start + batch_size]
+            frame = frame.astype(object).where(frame.notna(), None)
+            yield frame.to_dict("records")
+        return
+
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        if not isinstance(batch[0], dict):
+            for row in batch:
+                if len(row) != len(columns):
+                    raise ValueError(
+                        f"row {row!r} has {len(row)} values for the "
+                        f"{len(columns)} columns {list(columns)}"
+                    )
+            batch = [dict(zip(columns, row)) for row in batch]
+        yield batch
+
+
+def _copy_text(value):
+    """
+    value in COPY's text format, None as the NULL marker \\N.
+    """
+    if value is None:
+        return "\\N"
+    text = value if isinstance(value, str) else str(value)
+    return (
+        text.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(connection, table, columns, batch):
+    """
+    COPY a list of dicts into table on a PostgreSQL connection.
+
+    The text format tells NULL (\\N) from an empty string, csv writes both as
+    an empty field.
+    """
+    buffer = io.StringIO()
+    for row in batch:
+        buffer.write("\t".join(_copy_text(row.get(column)) for column in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    preparer = connection.dialect.identifier_preparer
+    quoted = ", ".join(preparer.quote(column) for column in columns)
+    table_name = preparer.format_table(table)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table_name} ({quoted}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+
+def bulk_insert(
+    bind,
+    model,
+    rows,
+    columns=None,
+    method="values",
+    batch_size=10000,
+    return_pks=False,
+):
+    """
+    Insert rows into the model's table in batches.
+
+    bind is a Session, Connection or Engine, a Session's transaction is left
+    open for the caller to commit. With return_pks the primary keys of the
+    new rows are collected using INSERT ... RETURNING, which needs the values
+    method and a database which supports it.
+
+    Returns a dict with rows, batches, seconds, rows_per_second and
+    primary_keys (None unless return_pks).
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, not {method!r}")
+    if return_pks and method != "values":
+        raise ValueError("return_pks requires the 'values' method")
+
+    if isinstance(bind, Engine):
+        with bind.begin() as connection:
+            return bulk_insert(
+                connection, model, rows, columns, method, batch_size, return_pks
+            )
+
+    table = model.__table__
+    connection = _connection(bind)
+    if method == "copy" and connection.dialect.name != "postgresql":
+        raise ValueError("the 'copy' method requires PostgreSQL")
+
+    if columns is None and hasattr(rows, "iloc"):
+        columns = list(rows.columns)
+    primary_keys = [] if return_pks else None
+    row_count = 0
+    batch_count = 0
+
+    if method == "values":
+        # dict rows may name any of the table's columns
+        width = len(columns) if columns else len(table.columns)
+        batch_size = max_batch_size(connection, width, batch_size)
+
+    start = time.perf_counter()
+    for batch in _batches(rows, columns or default_columns(model), batch_size):
+        if method == "executemany":
+            connection.execute(table.insert(), batch)
+        elif method == "values":
+            stmt = table.insert().values(batch)
+            if return_pks:
+                stmt = stmt.returning(*_primary_key(model))
+                primary_keys.extend(connection.execute(stmt).fetchall())
+            else:
+                connection.execute(stmt)
+        else:
+            copy_rows(connection, table, columns or list(batch[0]), batch)
+        row_count += len(batch)
+        batch_count += 1
+    seconds = time.perf_counter() - start
+
+    return {
+        "rows": row_count,
+        "batches": batch_count,
+        "seconds": seconds,
+        "rows_per_second": row_count / seconds if seconds else 0.0,
+        "primary_keys": primary_keys,
+    }
+
+
+# region set based update / delete
+
+
+class Values(FromClause):
+    """
+    (VALUES (...), (...)) AS name (columns) - a table of literal rows, every
+    value a bound parameter cast to its column's type.
+    """
+
+    named_with_column = True
+
+    def __init__(self, columns, rows, name):
+        self._column_args = columns
+        self.rows = rows
+        self.name = name
+
+    def _populate_column_collection(self):
+        for column in self._column_args:
+            column._make_proxy(self)
+
+    @property
+    def _from_objects(self):
+        return [self]
+
+
+@compiles(Values)
+def _compile_values(element, compiler, asfrom=False, **kw):
+    columns = element._column_args
+    rows = ", ".join(
+        "({})".format(
+            ", ".join(
+                compiler.process(
+                    cast(bindparam(None, value, type_=column.type), column.type),
+                    **kw,
+                )
+                for column, value in zip(columns, row)
+            )
+        )
+        for row in element.rows
+    )
+    sql = f"(VALUES {rows})"
+    if asfrom:
+        preparer = compiler.preparer
+        names = ", ".join(preparer.quote(column.name) for column in columns)
+        sql = f"{sql} AS {preparer.quote(element.name)} ({names})"
+    return sql
+
+
+def _check_synchronize(synchronize_session):
+    if synchronize_session is False or synchronize_session is None:
+        return "none"
+    if synchronize_session not in SYNCHRONIZE:
+        raise ValueError(
+            f"synchronize_session must be one of {SYNCHRONIZE}, "
+            f"not {synchronize_session!r}"
+        )
+    return synchronize_session
+
+
+def _attribute_keys(mapper, table, names):
+    return [mapper.get_property_by_column(table.c[name]).key for name in names]
+
+
+def _objects(session, model):
+    return [obj for obj in session.identity_map.values() if isinstance(obj, model)]
+
+
+def _remove_from_session(session, objects):
+    # as Query.delete(): the objects become detached, as if deleted and flushed
+    session._remove_newly_deleted([inspect(obj) for obj in objects])
+
+
+def _synchronize_update(session, model, key, columns, rows, strategy):
+    mapper = inspect(model)
+    table = model.__table__
+    key_attrs = _attribute_keys(mapper, table, key)
+    set_attrs = _attribute_keys(mapper, table, columns)
+    new_values = {tuple(row[name] for name in key): row for row in rows}
+    for obj in _objects(session, model):
+        loaded = inspect(obj).dict
+        if not all(attr in loaded for attr in key_attrs):
+            # key not loaded, the object reloads everything on access anyway
+            continue
+        row = new_values.get(tuple(loaded[attr] for attr in key_attrs))
+        if row is None:
+            continue
+        if strategy == "evaluate":
+            for attr, name in zip(set_attrs, columns):
+                set_committed_value(obj, attr, row[name])
+        else:
+            session.expire(obj, set_attrs)
+
+
+def bulk_update(
+    bind,
+    model,
+    rows,
+    columns=None,
+    key=None,
+    synchronize_session="evaluate",
+    batch_size=10000,
+):
+    """
+    Update the model's rows matching each row's key columns (the primary key
+    by default) to the row's other values, in batches.
+
+    Rows are dicts, tuples in the order of columns or a DataFrame, every row
+    holding the same columns: the key and the columns to set. bind is a
+    Session, Connection or Engine, a Session's transaction is left open for
+    the caller to commit and its objects synchronized.
+
+    Returns a dict with rows (the number updated), batches and seconds.
+    """
+    strategy = _check_synchronize(synchronize_session)
+    if isinstance(bind, Engine):
+        with bind.begin() as connection:
+            return bulk_update(
+                connection, model, rows, columns, key, strategy, batch_size
+            )
+
+    table = model.__table__
+    key = key or [column.name for column in _primary_key(model)]
+    if columns is None and hasattr(rows, "iloc"):
+        columns = list(rows.columns)
+    connection = _connection(bind)
+    session = bind if isinstance(bind, Session) else None
+    if connection.dialect.name == "postgresql":
+        # a parameter per value of the VALUES list, elsewhere executemany
+        # binds one row at a time
+        width = len(columns) if columns else len(table.columns)
+        batch_size = max_batch_size(connection, width, batch_size)
+    row_count = 0
+    batch_count = 0
+
+    start = time.perf_counter()
+    for batch in _batches(rows, columns, batch_size):
+        names = columns or list(batch[0])
+        updated = [name for name in names if name not in key]
+        if connection.dialect.name == "postgresql":
+            values = Values(
+                [table.c[name] for name in names],
+                [[row[name] for name in names] for row in batch],
+                "v",
+            )
+            stmt = (
+                table.update()
+                .values({name: values.c[name] for name in updated})
+                .where(and_(*(table.c[name] == values.c[name] for name in key)))
+            )
+            result = connection.execute(stmt)
+        else:
+            stmt = (
+                table.update()
+                .values({name: bindparam(f"v_{name}") for name in updated})
+                .where(
+                    and_(*(table.c[name] == bindparam(f"v_{name}") for name in key))
+                )
+            )
+            params = [{f"v_{name}": row[name] for name in names} for row in batch]
+            result = connection.execute(stmt, params)
+        row_count += result.rowcount
+        batch_count += 1
+        if session is not None and strategy != "none":
+            _synchronize_update(session, model, key, updated, batch, strategy)
+    seconds = time.perf_counter() - start
+
+    return {"rows": row_count, "batches": batch_count, "seconds": seconds}
+
+
+def bulk_delete(bind, model, *criteria, synchronize_session="evaluate"):
+    """
+    Delete the model's rows matching criteria, which may join other tables:
+
+        bulk_delete(session, Address, Address.user_id == User.id, User.name == "jack")
+
+    bind is a Session, Connection or Engine, a Session's transaction is left
+    open for the caller to commit and its objects synchronized.
+
+    Returns a dict with rows (the number deleted) and seconds.
+    """
+    strategy = _check_synchronize(synchronize_session)
+    if isinstance(bind, Engine):
+        with bind.begin() as connection:
+            return bulk_delete(
+                connection, model, *criteria, synchronize_session=strategy
+            )
+
+    mapper = inspect(model)
+    table = model.__table__
+    primary_key = _primary_key(model)
+    where = and_(*criteria)
+    connection = _connection(bind)
+    session = bind if isinstance(bind, Session) else None
+    if session is None:
+        strategy = "none"
+
+    matched = None
+    if strategy == "evaluate":
+        try:
+            evaluate = EvaluatorCompiler(mapper.class_).process(where)
+        except UnevaluatableError as error:
+            raise InvalidRequestError(
+                f"Could not evaluate the criteria in python: {error}. "
+                f"Use synchronize_session 'fetch' or 'none'."
+            )
+        matched = [obj for obj in _objects(session, model) if evaluate(obj)]
+
+    start = time.perf_counter()
+    keys = None
+    if connection.dialect.name == "postgresql":
+        # other tables in the criteria become DELETE ... USING
+        stmt = table.delete().where(where)
+        if strategy == "fetch":
+            stmt = stmt.returning(*primary_key)
+            keys = [tuple(row) for row in connection.execute(stmt)]
+            row_count = len(keys)
+        else:
+            row_count = connection.execute(stmt).rowcount
+    else:
+        matching = select(primary_key).where(where)
+        if strategy == "fetch":
+            keys = [tuple(row) for row in connection.execute(matching)]
+        if len(primary_key) == 1:
+            stmt = table.delete().where(primary_key[0].in_(matching))
+        else:
+            stmt = table.delete().where(tuple_(*primary_key).in_(matching))
+        row_count = connection.execute(stmt).rowcount
+    seconds = time.perf_counter() - start
+
+    if keys is not None:
+        matched = []
+        for pk in keys:
+            obj = session.identity_map.get(mapper.identity_key_from_primary_key(pk))
+            if obj is not None:
+                matched.append(obj)
+    if matched:
+        _remove_from_session(session, matched)
+
+    return {"rows": row_count, "seconds": seconds}
+
+
+class Truncate(Executable, ClauseElement):
+    """
+    TRUNCATE tables [RESTART IDENTITY] - a statement rather than a string, so
+    engine events (orm.result_cache) can see which tables it empties.
+    """
+
+    _execution_options = Executable._execution_options.union({"autocommit": True})
+
+    def __init__(self, tables, restart_identity=False):
+        self.tables = tables
+        self.restart_identity = restart_identity
+
+
+@compiles(Truncate)
+def _compile_truncate(element, compiler, **kw):
+    preparer = compiler.preparer
+    names = ", ".join(preparer.format_table(table) for table in element.tables)
+    options = " RESTART IDENTITY" if element.restart_identity else ""
+    return f"TRUNCATE {names}{options}"
+
+
+def _truncated_tables(models, cascade):
+    """
+    The tables truncating models empties, children first: with cascade every
+    table referencing them, then the tables TRUNCATED_WITH them - after, the
+    triggers of a DELETE would mark them again.
+    """
+    tables = {model.__table__ for model in models}
+    if cascade:
+        while True:
+            referencing = {
+                table
+                for table in Base.metadata.sorted_tables
+                if any(fk.column.table in tables for fk in table.foreign_keys)
+            }
+            if referencing <= tables:
+                break
+            tables |= referencing
+    ordered = [t for t in reversed(Base.metadata.sorted_tables) if t in tables]
+    for table in list(ordered):
+        ordered.extend(t for t in TRUNCATED_WITH.get(table, []) if t not in ordered)
+    return ordered
+
+
+def truncate(
+    bind,
+    *models,
+    cascade=False,
+    restart_identity=False,
+    count=False,
+    synchronize_session="evaluate",
+):
+    """
+    Empty the models' tables. cascade also empties the tables referencing
+    them, restart_identity resets their sequences (postgresql).
+
+    TRUNCATE doesn't report a row count, with count=True the rows are counted
+    first (a scan of each table). Elsewhere the rows are deleted and counted.
+    bind is a Session, Connection or Engine, a Session's transaction is left
+    open for the caller to commit and, unless synchronize_session is "none",
+    its objects of the emptied tables removed.
+
+    Returns a dict with rows (the number removed, None when not counted),
+    tables and seconds.
+    """
+    strategy = _check_synchronize(synchronize_session)
+    if isinstance(bind, Engine):
+        with bind.begin() as connection:
+            return truncate(
+                connection,
+                *models,
+                cascade=cascade,
+                restart_identity=restart_identity,
+                count=count,
+                synchronize_session=strategy,
+            )
+
+    tables = _truncated_tables(models, cascade)
+    connection = _connection(bind)
+    start = time.perf_counter()
+    if connection.dialect.name == "postgresql":
+        row_count = None
+        if count:
+            row_count = sum(
+                connection.execute(select([func.count()]).select_from(table)).scalar()
+                for table in tables
+            )
+        connection.execute(Truncate(tables, restart_identity))
+    else:
+        row_count = sum(connection.execute(table.delete()).rowcount for table in tables)
+    seconds = time.perf_counter() - start
+
+    if isinstance(bind, Session) and strategy != "none":
+        removed = [
+            obj
+            for obj in bind.identity_map.values()
+            if inspect(obj).mapper.local_table in tables
+        ]
+        if removed:
+            _remove_from_session(bind, removed)
+
+    return {
+        "rows": row_count,
+        "tables": [table.name for table in tables],
+        "seconds": seconds,
+    }
+
+
+# endregion
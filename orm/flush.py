@@ -0,0 +1,93 @@
+"""
+Batched flush
+The unit of work INSERTs pending objects with an autoincrement primary key
+one at a time, each needs its id back (INSERT ... RETURNING id) before the
+next, and before the children whose foreign keys point at it. Objects whose
+primary key is already set it groups into one executemany per table, which
+psycopg2 sends as multi-row INSERTs (executemany_mode="values", see engine.py).
+
+The before_flush hook here reserves the ids of each table's pending objects
+from its sequence in one statement, then lets the flush run as usual:
+
+    session.add_all([User(name="wendy"), User(name="mary"), User(name="fred")])
+    session.commit()
+    # SELECT nextval(pg_get_serial_sequence('example_user', 'id'))
+    #     FROM generate_series(1, 3)
+    # INSERT INTO example_user (id, name, full_name) VALUES (...), (...), (...)
+
+A User with its Addresses is two statements per table whatever their number:
+the parents' ids are set before the flush, the flush copies them into the
+children's user_id and inserts parents before children as always.
+
+Opt in per session factory with enable_batched_flush(), the project's
+orm.session.session_factory has it unless DB_BATCHED_FLUSH=0. postgresql
+only, elsewhere, and for a single pending object of a table, the flush is
+unchanged. Reserved ids are not returned on rollback, like any sequence value.
+"""
+from sqlalchemy import event, inspect, text
+
+# fewer pending objects of a table than this are inserted as usual
+MIN_BATCH = 2
+
+
+def reserve_ids(connection, column, count):
+    """
+    count new values from the sequence of column, a serial primary key,
+    ascending.
+    """
+    stmt = text(
+        "SELECT nextval(pg_get_serial_sequence(:table, :column)) "
+        "FROM generate_series(1, :count)"
+    )
+    # the table is parsed as an identifier, quoted as needed and schema
+    # qualified, the column name is taken literally
+    table = connection.dialect.identifier_preparer.format_table(column.table)
+    rows = connection.execute(stmt, table=table, column=column.name, count=count)
+    return sorted(row[0] for row in rows)
+
+
+def _pending_without_ids(session):
+    """
+    {(mapper, column): [object]} of the new objects whose autoincrement
+    primary key is not set, in the order they were added.
+    """
+    pending = {}
+    for obj in session.new:
+        state = inspect(obj)
+        mapper = state.mapper
+        column = mapper.local_table._autoincrement_column
+        if column is None:
+            continue
+        key = mapper.get_property_by_column(column).key
+        if state.dict.get(key) is None:
+            pending.setdefault((mapper, column), []).append(state)
+    return {
+        group: [state.obj() for state in sorted(states, key=lambda s: s.insert_order)]
+        for group, states in pending.items()
+    }
+
+
+def _reserve_flush_ids(session, flush_context, instances):
+    for (mapper, column), objects in _pending_without_ids(session).items():
+        if len(objects) < MIN_BATCH:
+            continue
+        connection = session.connection(mapper=mapper)
+        if connection.dialect.name != "postgresql":
+            continue
+        key = mapper.get_property_by_column(column).key
+        for obj, id_ in zip(objects, reserve_ids(connection, column, len(objects))):
+            setattr(obj, key, id_)
+
+
+def enable_batched_flush(target):
+    """
+    Reserve ids before each flush of target, a sessionmaker, session or
+    Session subclass.
+    """
+    if not event.contains(target, "before_flush", _reserve_flush_ids):
+        event.listen(target, "before_flush", _reserve_flush_ids)
+
+
+def disable_batched_flush(target):
+    if event.contains(target, "before_flush", _reserve_flush_ids):
+        event.remove(target, "before_flush", _reserve_flush_ids)
@@ -0,0 +1,170 @@
+"""
+Streaming ingest for the executedrecipe fact table.
+
+Rows arrive keyed by recipe_name / ingredient_name (or already by id), are
+resolved to ids through an in memory lookup of Recipe and Ingredient, and are
+streamed into executedrecipe with PostgreSQL COPY in chunks of chunk_size rows
+so memory stays bounded however large the source is.
+
+on_conflict decides what happens to rows which collide with the
+(recipe_id, ingredient_id, date) unique constraint:
+
+- "error"   - COPY straight into executedrecipe, a duplicate aborts the load
+- "ignore"  - keep the existing row
+- "update"  - overwrite the existing quantity
+
+The last two COPY into a temporary staging table and INSERT ... ON CONFLICT
+from there. Within a chunk the last row for a key wins.
+"""
+import csv
+import time
+from itertools import islice
+
+from sqlalchemy import MetaData, Table, Column, Integer, BigInteger, Float, Date
+from sqlalchemy import select, desc
+from sqlalchemy.dialects.postgresql import insert
+
+from orm.bulk import copy_rows
+from orm.models import Recipe, Ingredient, ExecutedRecipe
+
+COLUMNS = ["recipe_id", "ingredient_id", "date", "quantity"]
+KEY = ["recipe_id", "ingredient_id", "date"]
+ON_CONFLICT = ("error", "ignore", "update")
+
+
+def load_lookups(session):
+    """
+    Name to id maps for recipes and ingredients.
+    """
+    recipes = dict(session.query(Recipe.recipe_name, Recipe.id))
+    ingredients = dict(session.query(Ingredient.ingredient_name, Ingredient.id))
+    return recipes, ingredients
+
+
+def read_csv(path):
+    """
+    Yield the rows of a csv file with a header row as dicts.
+    """
+    with open(path, newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def read_parquet(path, batch_size=65536):
+    """
+    Yield the rows of a parquet file as dicts, one record batch at a time.
+    """
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+def _rows_from(source):
+    if isinstance(source, str):
+        if source.endswith(".parquet"):
+            return read_parquet(source)
+        return read_csv(source)
+    return iter(source)
+
+
+def _resolve(row, recipes, ingredients):
+    try:
+        recipe_id = row.get("recipe_id") or recipes[row["recipe_name"]]
+        ingredient_id = (
+            row.get("ingredient_id") or ingredients[row["ingredient_name"]]
+        )
+    except KeyError as e:
+        raise ValueError(f"unknown recipe or ingredient {e} in row {row!r}")
+    return {
+        "recipe_id": recipe_id,
+        "ingredient_id": ingredient_id,
+        "date": row["date"],
+        "quantity": row["quantity"],
+    }
+
+
+def _staging_table(name):
+    return Table(
+        name,
+        MetaData(),
+        Column("recipe_id", Integer()),
+        Column("ingredient_id", Integer()),
+        Column("date", Date()),
+        Column("quantity", Float()),
+        # COPY fills seq in file order, used to keep the last row per key
+        Column("seq", BigInteger(), autoincrement=True, primary_key=True),
+        prefixes=["TEMPORARY"],
+    )
+
+
+def _merge_statement(stage, on_conflict):
+    latest = (
+        select([stage.c[column] for column in COLUMNS])
+        .distinct(*[stage.c[column] for column in KEY])
+        .order_by(*[stage.c[column] for column in KEY], desc(stage.c.seq))
+    )
+    stmt = insert(ExecutedRecipe.__table__).from_select(COLUMNS, latest)
+    if on_conflict == "ignore":
+        return stmt.on_conflict_do_nothing(index_elements=KEY)
+    return stmt.on_conflict_do_update(
+        index_elements=KEY, set_={"quantity": stmt.excluded.quantity}
+    )
+
+
+def ingest_executed_recipes(
+    session, source, chunk_size=50000, on_conflict="error", lookups=None
+):
+    """
+    Stream source into executedrecipe using COPY.
+
+    source is an iterable of dicts (or a path to a .csv or .parquet file) with
+    recipe_name or recipe_id, ingredient_name or ingredient_id, date and
+    quantity. lookups, as returned by load_lookups(), can be passed in to
+    avoid reloading them. The session's transaction is left open for the
+    caller to commit.
+
+    Returns a dict with rows, chunks, seconds and rows_per_second.
+    """
+    if on_conflict not in ON_CONFLICT:
+        raise ValueError(f"on_conflict must be one of {ON_CONFLICT}")
+    connection = session.connection()
+    if connection.dialect.name != "postgresql":
+        raise ValueError("COPY ingest requires PostgreSQL")
+
+    recipes, ingredients = lookups or load_lookups(session)
+    rows = _rows_from(source)
+
+    stage = None
+    if on_conflict != "error":
+        stage = _staging_table("executedrecipe_stage")
+        stage.create(connection)
+        merge = _merge_statement(stage, on_conflict)
+
+    row_count = 0
+    chunk_count = 0
+    start = time.perf_counter()
+    while True:
+        chunk = [
+            _resolve(row, recipes, ingredients) for row in islice(rows, chunk_size)
+        ]
+        if not chunk:
+            break
+        if stage is None:
+            copy_rows(connection, ExecutedRecipe.__table__, COLUMNS, chunk)
+        else:
+            copy_rows(connection, stage, COLUMNS, chunk)
+            connection.execute(merge)
+            connection.execute(f"TRUNCATE {stage.name}")
+        row_count += len(chunk)
+        chunk_count += 1
+    # on failure the rollback takes the staging table with it
+    if stage is not None:
+        stage.drop(connection)
+    seconds = time.perf_counter() - start
+
+    return {
+        "rows": row_count,
+        "chunks": chunk_count,
+        "seconds": seconds,
+        "rows_per_second": row_count / seconds if seconds else 0.0,
+    }
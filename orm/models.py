@@ -1,10 +1,49 @@
-from sqlalchemy import Column, Integer, String, Float, Date
-from sqlalchemy import ForeignKey, UniqueConstraint
-from sqlalchemy.orm import relationship
+import os
+
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime
+from sqlalchemy import ForeignKey, UniqueConstraint, Index
+from sqlalchemy import DDL, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import relationship, backref
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.schema import CreateIndex
 
 Base = declarative_base()
 
+# DB_PARTITION_EXECUTEDRECIPE=1 creates executedrecipe range partitioned by
+# month on postgresql (11+), see orm.partitions for the monthly partitions
+_partition = os.getenv("DB_PARTITION_EXECUTEDRECIPE", "0").lower()
+PARTITION_EXECUTEDRECIPE = _partition in ("1", "true", "yes", "on")
+
+# region covering indexes
+
+# INCLUDE (...) columns for postgresql indexes, native in SQLAlchemy 1.4
+Index.argument_for("postgresql", "include", None)
+
+
+@compiles(CreateIndex, "postgresql")
+def _create_index_include(create, compiler, **kw):
+    text = compiler.visit_create_index(create)
+    include = create.element.dialect_options["postgresql"]["include"]
+    if not include:
+        return text
+    # INCLUDE follows the column list, before any WITH / TABLESPACE / WHERE
+    found = [text.find(clause) for clause in (" WITH (", " TABLESPACE ", " WHERE ")]
+    end = min([i for i in found if i >= 0], default=len(text))
+    columns = ", ".join(compiler.preparer.quote(column) for column in include)
+    return f"{text[:end]} INCLUDE ({columns}){text[end:]}"
+
+
+# endregion
+
+# default loader strategy per relationship - "select" (lazy), "joined",
+# "subquery" or "selectin". benchmarks/loaders.py measures each of them.
+LOADER_STRATEGIES = {
+    "User.addresses": "select",
+    "ExecutedRecipe.recipe": "select",
+    "ExecutedRecipe.ingredient": "select",
+}
+
 
 class User(Base):
     __tablename__ = "example_user"  # user clashes with psql user
@@ -24,7 +63,10 @@ class Address(Base):
     email_address = Column(String, nullable=False)
     user_id = Column(Integer(), ForeignKey("example_user.id"))
 
-    user = relationship("User", backref="addresses")
+    user = relationship(
+        "User",
+        backref=backref("addresses", lazy=LOADER_STRATEGIES["User.addresses"]),
+    )
 
     def __repr__(self):
         return "<Address({})".format(self.email_address)
@@ -76,14 +118,163 @@ class ExecutedRecipe(Base):
     """
 
     __tablename__ = "executedrecipe"
+    __table_args__ = (
+        # also the index for lookups by recipe (and ingredient)
+        UniqueConstraint("recipe_id", "ingredient_id", "date"),
+        # date bounded reports, index only scans on postgresql
+        Index(
+            "ix_executedrecipe_date_recipe_ingredient",
+            "date",
+            "recipe_id",
+            "ingredient_id",
+            postgresql_include=["quantity"],
+        ),
+        # ON DELETE CASCADE from ingredient
+        Index("ix_executedrecipe_ingredient_id", "ingredient_id"),
+    )
+    if PARTITION_EXECUTEDRECIPE:
+        __table_args__ += ({"postgresql_partition_by": "RANGE (date)"},)
 
     id = Column(Integer(), primary_key=True, autoincrement=True)
     recipe_id = Column(Integer(), ForeignKey("recipe.id", ondelete="cascade"))
     ingredient_id = Column(Integer(), ForeignKey("ingredient.id", ondelete="cascade"))
-    date = Column(Date(), nullable=False)
+    # the primary key of a partitioned table has to include the partition
+    # key, the mapper keeps using id alone
+    date = Column(Date(), nullable=False, primary_key=PARTITION_EXECUTEDRECIPE)
     quantity = Column(Float(), nullable=False)
 
-    UniqueConstraint("recipe_id", "ingredient_id", "date")
+    __mapper_args__ = {"primary_key": [id]}
+
+    recipe = relationship("Recipe", lazy=LOADER_STRATEGIES["ExecutedRecipe.recipe"])
+    ingredient = relationship(
+        "Ingredient", lazy=LOADER_STRATEGIES["ExecutedRecipe.ingredient"]
+    )
+
+
+class DailyQuantity(Base):
+    """
+    Summary of executedrecipe - quantity per (recipe, ingredient, date).
+    Maintained by orm.summary.refresh_summary().
+    ┌───────────┬───────────────┬──────┬──────────┐
+    │ recipe_id │ ingredient_id │ date │ quantity │
+    ├───────────┼───────────────┼──────┼──────────┤
+    │         1 │             2 │ 1/1  │      100 │
+    │         1 │             3 │ 1/1  │      500 │
+    └───────────┴───────────────┴──────┴──────────┘
+    """
+
+    __tablename__ = "executedrecipe_daily"
+    # refresh_summary() replaces whole dates, the reports read date ranges
+    __table_args__ = (
+        Index(
+            "ix_executedrecipe_daily_date",
+            "date",
+            postgresql_include=["quantity"],
+        ),
+    )
+
+    recipe_id = Column(
+        Integer(), ForeignKey("recipe.id", ondelete="cascade"), primary_key=True
+    )
+    ingredient_id = Column(
+        Integer(), ForeignKey("ingredient.id", ondelete="cascade"), primary_key=True
+    )
+    date = Column(Date(), primary_key=True)
+    quantity = Column(Float(), nullable=False)
 
     recipe = relationship("Recipe")
     ingredient = relationship("Ingredient")
+
+
+class DirtyDate(Base):
+    """
+    Dates with executedrecipe changes not yet in executedrecipe_daily,
+    written by triggers on executedrecipe.
+    """
+
+    __tablename__ = "executedrecipe_dirty_date"
+
+    date = Column(Date(), primary_key=True)
+
+
+class SummaryRefresh(Base):
+    """
+    When each summary table was last refreshed, no row means never.
+    """
+
+    __tablename__ = "summary_refresh"
+
+    name = Column(String(), primary_key=True)
+    refreshed_at = Column(DateTime(), nullable=False)
+
+
+# region executedrecipe change tracking triggers
+
+_PG_MARK_DIRTY = """
+CREATE OR REPLACE FUNCTION executedrecipe_mark_dirty() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO executedrecipe_dirty_date (date)
+        SELECT DISTINCT date FROM new_rows ON CONFLICT DO NOTHING;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO executedrecipe_dirty_date (date)
+        SELECT DISTINCT date FROM old_rows ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def _change_tracking_ddl():
+    """
+    (dialect, statement) pairs creating triggers which record the dates of
+    every insert, update and delete on executedrecipe in
+    executedrecipe_dirty_date. Safe to run again on an existing schema.
+    """
+    yield "postgresql", _PG_MARK_DIRTY
+    # statement level, the changed dates are read once from transition tables
+    for op, referencing in [
+        ("insert", "NEW TABLE AS new_rows"),
+        ("update", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+        ("delete", "OLD TABLE AS old_rows"),
+    ]:
+        yield "postgresql", (
+            f"DROP TRIGGER IF EXISTS executedrecipe_dirty_{op} ON executedrecipe"
+        )
+        yield "postgresql", (
+            f"CREATE TRIGGER executedrecipe_dirty_{op} "
+            f"AFTER {op.upper()} ON executedrecipe REFERENCING {referencing} "
+            f"FOR EACH STATEMENT EXECUTE PROCEDURE executedrecipe_mark_dirty()"
+        )
+
+    for op, rows in [("insert", ["NEW"]), ("update", ["OLD", "NEW"]), ("delete", ["OLD"])]:
+        inserts = " ".join(
+            f"INSERT OR IGNORE INTO executedrecipe_dirty_date (date) VALUES ({row}.date);"
+            for row in rows
+        )
+        yield "sqlite", (
+            f"CREATE TRIGGER IF NOT EXISTS executedrecipe_dirty_{op} "
+            f"AFTER {op.upper()} ON executedrecipe BEGIN {inserts} END"
+        )
+
+
+# rows of months without a partition, see orm.partitions
+event.listen(
+    ExecutedRecipe.__table__,
+    "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS executedrecipe_default "
+        "PARTITION OF executedrecipe DEFAULT"
+    ).execute_if(
+        dialect="postgresql", callable_=lambda *args, **kw: PARTITION_EXECUTEDRECIPE
+    ),
+)
+
+for dialect, statement in _change_tracking_ddl():
+    event.listen(
+        Base.metadata, "after_create", DDL(statement).execute_if(dialect=dialect)
+    )
+
+# endregion
@@ -0,0 +1,147 @@
+"""
+N plus one detection
+
+Counts the statements executed within a unit of work and fingerprints them
+by shape (the SQL with parameters left as placeholders and IN lists
+collapsed). When the same SELECT shape runs threshold times in one unit of
+work it is flagged as an N + 1, together with the relationship being lazy
+loaded (e.g. User.addresses) and the first line of application code which
+caused it.
+
+    install(engine)
+
+    with track(threshold=5) as tracker:
+        for user in session.query(User):
+            print(user.addresses)
+    print(tracker.detections)
+
+Only tracked units of work pay anything beyond a context variable lookup, and
+sample_rate tracks a fraction of them so it can be left on in production.
+With raise_on_detect (test suites) the offending statement raises
+NPlusOneError instead of running.
+"""
+import contextvars
+import logging
+import os
+import random
+import sys
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from metrics import fingerprint
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("nplusone_tracker", default=None)
+
+_SQLALCHEMY_DIR = os.path.dirname(sys.modules["sqlalchemy"].__file__)
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+def _origin():
+    """
+    The relationship being lazy loaded and the first frame of application
+    code on the current stack.
+    """
+    relationship = None
+    caller = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.startswith(_SQLALCHEMY_DIR):
+            loader = frame.f_locals.get("self")
+            if relationship is None and code.co_name == "_load_for_state":
+                relationship = str(getattr(loader, "parent_property", None))
+        elif caller is None and code.co_filename not in (__file__, "<string>"):
+            caller = f"{code.co_filename}:{frame.f_lineno} in {code.co_name}"
+        frame = frame.f_back
+    return relationship, caller
+
+
+class StatementTracker:
+    def __init__(self, threshold=5, raise_on_detect=False):
+        self.threshold = threshold
+        self.raise_on_detect = raise_on_detect
+        self.statements = 0
+        self.counts = Counter()
+        self.detections = []
+
+    def record(self, statement):
+        self.statements += 1
+        shape = fingerprint(statement)
+        self.counts[shape] += 1
+        if self.counts[shape] != self.threshold:
+            return
+        if not shape.upper().startswith("SELECT"):
+            return
+
+        relationship, caller = _origin()
+        detection = {
+            "statement": shape,
+            "relationship": relationship,
+            "caller": caller,
+            "threshold": self.threshold,
+        }
+        self.detections.append(detection)
+        logger.warning(
+            "N+1 query: %s repeated %s times, lazy loading %s from %s",
+            shape,
+            self.threshold,
+            relationship,
+            caller,
+        )
+        if self.raise_on_detect:
+            raise NPlusOneError(
+                f"N+1 query loading {relationship} from {caller}: {shape}"
+            )
+
+    def report(self):
+        """
+        Total statements, the repeated shapes with their counts and the
+        detections.
+        """
+        return {
+            "statements": self.statements,
+            "repeated": {
+                shape: count for shape, count in self.counts.items() if count > 1
+            },
+            "detections": list(self.detections),
+        }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    tracker = _current.get()
+    if tracker is not None:
+        tracker.record(statement)
+
+
+def install(engine):
+    """
+    Hook statement tracking into engine, idempotent.
+    """
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+
+
+@contextmanager
+def track(threshold=5, raise_on_detect=False, sample_rate=1.0):
+    """
+    Track the statements of the unit of work within the block.
+
+    Yields the StatementTracker, or None when this unit of work wasn't
+    sampled.
+    """
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        yield None
+        return
+    tracker = StatementTracker(threshold, raise_on_detect)
+    token = _current.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current.reset(token)
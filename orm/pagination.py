@@ -0,0 +1,213 @@
+"""
+Keyset pagination
+query[page * size:(page + 1) * size] is OFFSET / LIMIT: the database still
+reads and throws away every row of the pages before, so page n costs O(n).
+Keyset (seek) pagination remembers the ORDER BY values of the last row of a
+page and starts the next one after them,
+
+    WHERE (name, id) > (:last_name, :last_id) ORDER BY name, id LIMIT :size
+
+which an index on (name, id) answers by seeking straight to the first row -
+every page costs the same.
+
+    q = session.query(User, Address).join(Address).order_by(User.name)
+    rows, cursor = keyset_page(q, page_size=50)
+    while cursor:
+        rows, cursor = keyset_page(q, cursor, page_size=50)
+
+The primary key of each entity of the query is appended to its ORDER BY, so
+the order is total and no row is skipped or repeated between pages. The order
+columns must be plain columns or expressions (not aggregates) and NOT NULL.
+The cursor is an opaque url safe string holding the last row's keys, None
+after the last page. Sort keys are strings, numbers, booleans, dates, times,
+datetimes, decimals, UUIDs or bytes.
+
+The query's own LIMIT / OFFSET are replaced by the page's.
+"""
+import base64
+import datetime as dt
+import decimal
+import json
+import uuid
+
+from sqlalchemy import and_, inspect, or_, tuple_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.expression import Label, UnaryExpression
+from sqlalchemy.util import KeyedTuple
+
+# region cursor tokens
+
+_JSON_TYPES = (str, int, float, bool, type(None))
+
+# (type, tag, encode, decode), datetime before its base class date
+_CODECS = [
+    (dt.datetime, "datetime", dt.datetime.isoformat, dt.datetime.fromisoformat),
+    (dt.date, "date", dt.date.isoformat, dt.date.fromisoformat),
+    (dt.time, "time", dt.time.isoformat, dt.time.fromisoformat),
+    (decimal.Decimal, "decimal", str, decimal.Decimal),
+    (uuid.UUID, "uuid", str, uuid.UUID),
+    (bytes, "bytes", lambda value: base64.b64encode(value).decode(), base64.b64decode),
+]
+_DECODERS = {tag: decode for _, tag, _, decode in _CODECS}
+
+
+def _encode_value(value):
+    for kind, tag, encode, _ in _CODECS:
+        if isinstance(value, kind):
+            return {tag: encode(value)}
+    if isinstance(value, _JSON_TYPES):
+        return value
+    raise ValueError(
+        f"can't put a {type(value).__name__} sort key into a cursor, order by "
+        f"columns of a supported type"
+    )
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        (kind, text), = value.items()
+        return _DECODERS[kind](text)
+    return value
+
+
+def encode_cursor(keys):
+    data = json.dumps([_encode_value(key) for key in keys], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return [_decode_value(key) for key in data]
+    except (ValueError, TypeError, KeyError) as error:
+        raise ValueError(f"invalid cursor {cursor!r}") from error
+
+
+# endregion
+
+
+def _order_by(query):
+    """
+    The ORDER BY clauses of query. SQLAlchemy 1.3 has no public accessor for
+    them, Query._order_by is the one private attribute this module reads.
+    """
+    return list(query._order_by or ())
+
+
+def _column(query, clause):
+    """
+    The expression an ORDER BY clause sorts on.
+    """
+    name = getattr(clause, "element", None)
+    if isinstance(name, str):
+        # order_by("name") - the query's column labelled so
+        for description in query.column_descriptions:
+            if description["name"] == name:
+                clause = description["expr"]
+                break
+        else:
+            raise ValueError(f"can't find the column {name!r} to order by")
+    if isinstance(clause, Label):
+        clause = clause.element
+    return clause
+
+
+def sort_keys(query):
+    """
+    (expression, descending) of each column of query's ORDER BY, followed by
+    the primary key columns of its entities not already in it.
+    """
+    order_by = _order_by(query)
+    if not order_by:
+        raise ValueError("keyset pagination needs an ordered query")
+    keys = []
+    for clause in order_by:
+        descending = False
+        if isinstance(clause, UnaryExpression):
+            if clause.modifier not in (operators.asc_op, operators.desc_op):
+                raise ValueError(f"can't paginate on {clause}")
+            descending = clause.modifier is operators.desc_op
+            clause = clause.element
+        keys.append((_column(query, clause), descending))
+
+    # tie breakers, sorted the same way as the last column
+    descending = keys[-1][1]
+    ordered = [expression for expression, _ in keys]
+    for description in query.column_descriptions:
+        entity = description["entity"]
+        if entity is None:
+            continue
+        info = inspect(entity)
+        for column in info.mapper.primary_key:
+            # the column as selected, through any alias of the entity
+            column = getattr(entity, info.mapper.get_property_by_column(column).key)
+            if not any(column.compare(other) for other in ordered):
+                keys.append((column, descending))
+                ordered.append(column)
+    return keys
+
+
+def seek_condition(keys, values):
+    """
+    The rows after values in the order of keys.
+    """
+    after = [
+        (expression < value) if descending else (expression > value)
+        for (expression, descending), value in zip(keys, values)
+    ]
+    if len(keys) == 1:
+        return after[0]
+    if len({descending for _, descending in keys}) == 1:
+        # a row value comparison, one index range scan
+        expressions = tuple_(*(expression for expression, _ in keys))
+        if keys[0][1]:
+            return expressions < tuple_(*values)
+        return expressions > tuple_(*values)
+    # mixed directions: a > x OR (a = x AND b < y) OR ...
+    return or_(
+        *(
+            and_(
+                *(
+                    expression == value
+                    for (expression, _), value in zip(keys[:i], values[:i])
+                ),
+                after[i],
+            )
+            for i in range(len(keys))
+        )
+    )
+
+
+def keyset_page(query, cursor=None, page_size=50):
+    """
+    The page of query after cursor (the first page when None): (rows, next
+    cursor), the cursor None after the last page. Rows are as query returns
+    them.
+    """
+    keys = sort_keys(query)
+    width = len(query.column_descriptions)
+
+    page = query.limit(None).offset(None).order_by(None).order_by(
+        *(expression.desc() if desc else expression for expression, desc in keys)
+    )
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        if len(values) != len(keys):
+            raise ValueError("the cursor is not one of this query's")
+        page = page.filter(seek_condition(keys, values))
+    # the sort keys ride along at the end of each row, one extra row tells
+    # whether there is a next page
+    page = page.add_columns(
+        *(expression.label(f"_key_{i}") for i, (expression, _) in enumerate(keys))
+    ).limit(page_size + 1)
+    results = page.all()
+
+    next_cursor = None
+    if len(results) > page_size:
+        results = results[:page_size]
+        next_cursor = encode_cursor(results[-1][width:])
+    if width == 1:
+        return [row[0] for row in results], next_cursor
+    labels = [description["name"] for description in query.column_descriptions]
+    return [KeyedTuple(row[:width], labels) for row in results], next_cursor
@@ -0,0 +1,114 @@
+"""
+Monthly partitions of executedrecipe
+
+With DB_PARTITION_EXECUTEDRECIPE=1 (postgresql only) executedrecipe is
+created range partitioned on date (see orm.models), and a report bounded by
+date (the spine's start and end, the between() of the sparse facts) only
+scans the partitions of those months - partition pruning.
+
+Rows go to executedrecipe_default, created with the table, until their
+month has a partition of its own. create_month_partitions() creates them,
+ahead of loading or afterwards, moving the month's rows out of the default
+partition:
+
+    create_month_partitions(engine, dt.date(2020, 1, 1), dt.date(2020, 12, 1))
+
+The indexes, the unique constraint and the change tracking triggers are
+declared on executedrecipe and apply to every partition.
+"""
+import datetime as dt
+
+from sqlalchemy import inspect
+
+from orm.models import Base, ExecutedRecipe
+
+TABLE = ExecutedRecipe.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+
+def is_partitioned(bind):
+    return bool(
+        bind.execute(
+            "SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(%(table)s)",
+            {"table": TABLE},
+        ).scalar()
+    )
+
+
+def _months(start, end):
+    month = dt.date(start.year, start.month, 1)
+    while month <= end:
+        following = dt.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        yield month, following
+        month = following
+
+
+def partition_name(month):
+    return f"{TABLE}_{month:%Y_%m}"
+
+
+def create_month_partitions(engine, start, end):
+    """
+    Create the missing partitions for the months of start to end, moving any
+    of their rows out of the default partition. Returns the names created.
+    """
+    created = []
+    with engine.begin() as connection:
+        for month, following in _months(start, end):
+            name = partition_name(month)
+            exists = connection.execute(
+                "SELECT to_regclass(%(name)s)", {"name": name}
+            ).scalar()
+            if exists:
+                continue
+            # attaching checks the rows, the default partition can't hold
+            # any of the month's either
+            connection.execute(
+                f"CREATE TABLE {name} "
+                f"(LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+            connection.execute(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                f"WHERE date >= %(start)s AND date < %(end)s RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved",
+                {"start": month, "end": following},
+            )
+            # partition bounds are literals, not parameters
+            connection.execute(
+                f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{month}') TO ('{following}')"
+            )
+            created.append(name)
+    return created
+
+
+def list_partitions(bind):
+    """
+    (name, bounds) of every partition of executedrecipe.
+    """
+    return [
+        tuple(row)
+        for row in bind.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%(table)s) ORDER BY c.relname",
+            {"table": TABLE},
+        )
+    ]
+
+
+def ensure_indexes(bind):
+    """
+    Create the declared indexes missing from tables which existed before they
+    were declared, create_all() only creates indexes with new tables.
+    """
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind)
@@ -0,0 +1,108 @@
+"""
+Async cross join reports
+
+The reports of orm.queries.cross_join and orm.queries.sparse awaited on an
+AsyncSession (orm.async_session). The statements are the same, built by the
+same functions, only their execution differs.
+
+dense_array() is where async pays off: the recipe names, ingredient names,
+date spine and non zero facts are independent queries, so they run at the
+same time on four connections and the report takes as long as the slowest
+of them rather than the sum.
+"""
+import asyncio
+
+from orm.queries.cross_join import (
+    a_time_data_as_query,
+    full_cross_join_on_two_variables_query,
+    grid_left_join_on_two_variables_query,
+)
+from orm.queries.date_spine import date_spine
+from orm.queries.pivot import DEFAULT_START, DEFAULT_END
+from orm.queries.sparse import (
+    recipe_names_query,
+    ingredient_names_query,
+    sparse_facts_query,
+    scatter,
+)
+
+
+async def full_cross_join_on_two_variables(
+    session,
+    start=DEFAULT_START,
+    end=DEFAULT_END,
+    step="1 month",
+    recipes=None,
+    ingredients=None,
+    report=full_cross_join_on_two_variables_query,
+):
+    """
+    The rows of report, the cross join or the left join grid, for dates start
+    to end every step.
+    """
+    sync_session = session.sync_session
+    dates = a_time_data_as_query(sync_session, start, end, step)
+    q = report(
+        sync_session,
+        dates=dates,
+        recipes=recipes,
+        ingredients=ingredients,
+        use_summary=session.summary_fresh,
+    )
+    return await session.all(q)
+
+
+async def grid_left_join_on_two_variables(
+    session, start=DEFAULT_START, end=DEFAULT_END, step="1 month", **filters
+):
+    return await full_cross_join_on_two_variables(
+        session,
+        start,
+        end,
+        step,
+        report=grid_left_join_on_two_variables_query,
+        **filters,
+    )
+
+
+async def dense_array(
+    session, start=DEFAULT_START, end=DEFAULT_END, step="1 month", sparse=False
+):
+    """
+    As orm.queries.sparse.dense_array(), with the dimension and fact queries
+    run concurrently.
+    """
+    sync_session = session.sync_session
+    spine = date_spine(sync_session, start, end, step)
+    recipes, ingredients, dates, facts = await asyncio.gather(
+        session.all(recipe_names_query(sync_session)),
+        session.all(ingredient_names_query(sync_session)),
+        session.all(sync_session.query(spine.c.date).order_by(spine.c.date)),
+        session.all(sparse_facts_query(sync_session, start, end)),
+    )
+    recipes = [row[0] for row in recipes]
+    ingredients = [row[0] for row in ingredients]
+    dates = [row[0] for row in dates]
+    values = scatter(recipes, ingredients, dates, facts, sparse)
+    return recipes, ingredients, dates, values
+
+
+async def run_example():
+    from async_engine import create_async_engine
+    from orm.async_session import AsyncSession
+
+    engine = await create_async_engine()
+    try:
+        session = AsyncSession(engine)
+        await session.prepare()
+        for row in await full_cross_join_on_two_variables(session):
+            print(tuple(row))
+        recipes, ingredients, dates, values = await dense_array(session)
+        print(recipes, ingredients, dates)
+        print(values)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_example())
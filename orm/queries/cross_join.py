@@ -1,54 +1,76 @@
 import datetime as dt
-import pandas as pd
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, literal, case, select, union_all, cast, Date, and_
+from sqlalchemy import func, literal, case, and_, bindparam
 
-from engine import engine
+from engine import get_engine
+from orm.bulk import bulk_insert, truncate
 from orm.models import Base, Recipe, Ingredient, ExecutedRecipe
+from orm.queries.date_spine import date_spine
+from orm.summary import executed_quantities_query
+from orm.streaming import stream_frames
 
-Base.metadata.create_all(bind=engine)
-session = Session(bind=engine)
+# region setup data
 
 
-session.query(Recipe).delete()
-session.query(Ingredient).delete()
-session.commit()
+def create_schema(engine=None):
+    Base.metadata.create_all(bind=engine or get_engine())
+
+
+def clear_data(session):
+    truncate(session, ExecutedRecipe, Recipe, Ingredient)
+    session.commit()
+
+
+def seed_data(session):
+    date = dt.date(year=2020, month=1, day=1)
+    date_1 = dt.date(year=2020, month=2, day=1)
+
+    bulk_insert(
+        session,
+        Recipe,
+        [(1, "Cake"), (2, "Fried Rice")],
+        columns=["id", "recipe_name"],
+    )
+    bulk_insert(
+        session,
+        Ingredient,
+        [
+            (1, "Milk"),
+            (2, "Eggs"),
+            (3, "Flour"),
+            (4, "Sugar"),
+            (5, "Butter"),
+            (6, "Baking Soda"),
+            (7, "Steak"),
+            (8, "Msg"),
+            (9, "Salt"),
+        ],
+        columns=["id", "ingredient_name"],
+    )
+    bulk_insert(
+        session,
+        ExecutedRecipe,
+        [
+            (1, 1, date, 200),
+            (1, 2, date, 100),
+            (1, 3, date, 500),
+            (1, 4, date, 80),
+            (2, 6, date_1, 200),
+            (2, 7, date_1, 100),
+            (2, 8, date_1, 500),
+            (2, 9, date_1, 80),
+        ],
+    )
+    session.commit()
+
 
-# region setup data
-date = dt.date(year=2020, month=1, day=1)
-date_1 = dt.date(year=2020, month=2, day=1)
-
-session.add_all(
-    [
-        Recipe(recipe_name="Cake", id=1),
-        Recipe(recipe_name="Fried Rice", id=2),
-        Ingredient(ingredient_name="Milk", id=1),
-        Ingredient(ingredient_name="Eggs", id=2),
-        Ingredient(ingredient_name="Flour", id=3),
-        Ingredient(ingredient_name="Sugar", id=4),
-        Ingredient(ingredient_name="Butter", id=5),
-        Ingredient(ingredient_name="Baking Soda", id=6),
-        Ingredient(ingredient_name="Steak", id=7),
-        Ingredient(ingredient_name="Msg", id=8),
-        Ingredient(ingredient_name="Salt", id=9),
-        ExecutedRecipe(recipe_id=1, ingredient_id=1, date=date, quantity=200),
-        ExecutedRecipe(recipe_id=1, ingredient_id=2, date=date, quantity=100),
-        ExecutedRecipe(recipe_id=1, ingredient_id=3, date=date, quantity=500),
-        ExecutedRecipe(recipe_id=1, ingredient_id=4, date=date, quantity=80),
-        ExecutedRecipe(recipe_id=2, ingredient_id=6, date=date_1, quantity=200),
-        ExecutedRecipe(recipe_id=2, ingredient_id=7, date=date_1, quantity=100),
-        ExecutedRecipe(recipe_id=2, ingredient_id=8, date=date_1, quantity=500),
-        ExecutedRecipe(recipe_id=2, ingredient_id=9, date=date_1, quantity=80),
-    ]
-)
-session.commit()
 # endregion
 
 # region Cross Join query
 
 
-def a_cross_join_query():
+def a_cross_join_query(session):
     """
     A
     ┌────┬─────────────┬─────────────────┬──────┬──────────┐
@@ -109,11 +131,10 @@ def a_cross_join_query():
         used_ingredients_sq.c.ingredient_used,
         Ingredient.ingredient_name,
     ).join(Ingredient, literal(True))
-    # df = pd.DataFrame(used_ingredients_cross_q)  # debug
     return used_ingredients_cross_q
 
 
-def b_cross_join_case_query():
+def b_cross_join_case_query(session):
     """
     With the product of A x B:
     If ingredient_used != ingredient from the cross product then we want to set the quantity to zero.
@@ -147,7 +168,7 @@ def b_cross_join_case_query():
     │ Cake   │ 1/1  │        0 │ Steak      │
     └────────┴──────┴──────────┴────────────┘
     """
-    cross_join_sq = a_cross_join_query().subquery()
+    cross_join_sq = a_cross_join_query(session).subquery()
     ingredients_match = (
             cross_join_sq.c.ingredient_used == cross_join_sq.c.ingredient_name
     )
@@ -159,11 +180,10 @@ def b_cross_join_case_query():
         ),
         cross_join_sq.c.ingredient_name,
     )
-    df = pd.DataFrame(q)  # debug
     return q
 
 
-def c_cross_join_group_by_query():
+def c_cross_join_group_by_query(session):
     """
     We group by previous query Table C which has 36 rows:
     ┌────────┬──────┬──────────┬────────────┐
@@ -194,7 +214,7 @@ def c_cross_join_group_by_query():
     └────────┴──────┴──────────┴────────────┘
     """
 
-    cross_case_join_sq = b_cross_join_case_query().subquery()
+    cross_case_join_sq = b_cross_join_case_query(session).subquery()
     q = session.query(
         cross_case_join_sq.c.recipe_name,
         cross_case_join_sq.c.date,
@@ -205,11 +225,10 @@ def c_cross_join_group_by_query():
         cross_case_join_sq.c.date,
         cross_case_join_sq.c.ingredient_name,
     )
-    df = pd.DataFrame(q)  # debug
     return q
 
 
-def full_cross_join_query():
+def full_cross_join_query(session, use_summary=False):
     """
     ┌────────┬──────┬──────────┬─────────────┐
     │ recipe │ date │ quantity │ ingredient  │
@@ -226,17 +245,8 @@ def full_cross_join_query():
     """
 
     # we need 1 subquery here to create a column "ingredient used"
-    sq = (
-        session.query(
-            Recipe.recipe_name,
-            ExecutedRecipe.date,
-            Ingredient.ingredient_name.label("ingredient_used"),
-            ExecutedRecipe.quantity,
-        )
-            .select_from(ExecutedRecipe)
-            .join(Ingredient, ExecutedRecipe.ingredient)
-            .join(Recipe, ExecutedRecipe.recipe)
-    ).subquery()
+    # (read from the daily summary with use_summary)
+    sq = executed_quantities_query(session, use_summary).subquery()
 
     has_ingredient_used = sq.c.ingredient_used == Ingredient.ingredient_name
 
@@ -252,7 +262,6 @@ def full_cross_join_query():
             .join(Ingredient, literal(True))
             .group_by(sq.c.recipe_name, sq.c.date, Ingredient.ingredient_name,)
     )
-    df = pd.DataFrame(q)  # debug
     return q
 
 
@@ -261,22 +270,48 @@ def full_cross_join_query():
 # region Cross Join on two variables query
 
 
-def a_time_data_as_query():
-    dates = [
-        dt.date(year=2020, month=1, day=1),
-        dt.date(year=2020, month=2, day=1),
-        dt.date(year=2020, month=3, day=1),
-        dt.date(year=2020, month=4, day=1),
-    ]
-    select_qs = [select([cast(literal(date), Date).label("date")]) for date in dates]
+def filter_names(q, recipe_column, ingredient_column, recipes=None, ingredients=None):
+    """
+    Limit a report to the given recipe and/or ingredient names. The names are
+    bound as expanding parameters, recipe_names and ingredient_names, so the
+    statement doesn't change with them.
+    """
+    if recipes is not None:
+        names = bindparam("recipe_names", list(recipes), expanding=True)
+        q = q.filter(recipe_column.in_(names))
+    if ingredients is not None:
+        names = bindparam("ingredient_names", list(ingredients), expanding=True)
+        q = q.filter(ingredient_column.in_(names))
+    return q
+
 
-    q = (union_all(*select_qs)).alias("Dates")
-    q = session.query(q)
-    df = pd.DataFrame(q)  # debug
+def a_time_data_as_query(
+    session,
+    start=dt.date(year=2020, month=1, day=1),
+    end=dt.date(year=2020, month=4, day=1),
+    step="1 month",
+    origin=None,
+):
+    """
+    The date dimension, one row per date from start to end every step (of
+    the steps from origin when given, see date_spine()).
+    ┌──────┐
+    │ Date │
+    ├──────┤
+    │ 1/1  │
+    │ 1/2  │
+    │ 1/3  │
+    │ 1/4  │
+    └──────┘
+    Built with a date spine (generate_series on postgres) so the statement is
+    the same size however long the range is.
+    """
+    spine = date_spine(session, start, end, step, name="Dates", origin=origin)
+    q = session.query(spine)
     return q
 
 
-def b_cross_join_on_two_variables_query():
+def b_cross_join_on_two_variables_query(session, dates=None, use_summary=False):
     """
     A - we've already cross joined on our first variable, now the for the second (we want an entry for every date)
     ┌────────┬──────┬──────────┬─────────────┐
@@ -317,8 +352,10 @@ def b_cross_join_on_two_variables_query():
     │ Cake        │ Sugar           │        0 │ 1/1       │ 1/2  │
     └─────────────┴─────────────────┴──────────┴───────────┴──────┘
     """
-    date_sq = a_time_data_as_query().subquery()
-    sq = full_cross_join_query().subquery()
+    if dates is None:
+        dates = a_time_data_as_query(session)
+    date_sq = dates.subquery()
+    sq = full_cross_join_query(session, use_summary).subquery()
     has_date = sq.c.date == date_sq.c.date
 
     q = session.query(
@@ -328,11 +365,10 @@ def b_cross_join_on_two_variables_query():
         date_sq.c.date,
         case([(has_date, sq.c.quantity)], else_=0).label("quantity"),
     ).join(date_sq, literal(True))
-    df = pd.DataFrame(q)  # debug
     return q
 
 
-def c_cross_join_group_by_on_second_var():
+def c_cross_join_group_by_on_second_var(session, dates=None):
     """
     ┌─────────────┬─────────────────┬──────────┬──────┐
     │ recipe_name │ ingredient_name │ quantity │ date │
@@ -353,7 +389,7 @@ def c_cross_join_group_by_on_second_var():
     │ Cake        │ Sugar           │        0 │ 1/3  │
     └─────────────┴─────────────────┴──────────┴──────┘
     """
-    sq = b_cross_join_on_two_variables_query().subquery()
+    sq = b_cross_join_on_two_variables_query(session, dates).subquery()
     q = (
         session.query(
             sq.c.recipe_name,
@@ -364,27 +400,25 @@ def c_cross_join_group_by_on_second_var():
             .group_by(sq.c.recipe_name, sq.c.ingredient_name, sq.c.date)
             .order_by(sq.c.recipe_name, sq.c.date, sq.c.ingredient_name)
     )
-    df = pd.DataFrame(q)  # debug
     return q
 
 
-def full_cross_join_on_two_variables_query():
+def full_cross_join_on_two_variables_query(
+    session, dates=None, recipes=None, ingredients=None, use_summary=False
+):
     """
+    dates is the date dimension query, a_time_data_as_query() by default.
+    recipes and ingredients optionally limit the report to those names.
+    use_summary reads the executed quantities from the daily summary, for
+    callers which found it fresh (orm.summary.summary_is_fresh()).
     """
     # date subquery
-    date_sq = a_time_data_as_query().subquery()
+    if dates is None:
+        dates = a_time_data_as_query(session)
+    date_sq = dates.subquery()
     # we need 1 subquery here to create a column "ingredient used"
-    sq = (
-        session.query(
-            Recipe.recipe_name,
-            ExecutedRecipe.date,
-            Ingredient.ingredient_name.label("ingredient_used"),
-            ExecutedRecipe.quantity,
-        )
-            .select_from(ExecutedRecipe)
-            .join(Ingredient, ExecutedRecipe.ingredient)
-            .join(Recipe, ExecutedRecipe.recipe)
-    ).subquery()
+    # (read from the daily summary with use_summary)
+    sq = executed_quantities_query(session, use_summary).subquery()
 
     has_ingredient_and_date = and_(
         sq.c.date == date_sq.c.date, sq.c.ingredient_used == Ingredient.ingredient_name
@@ -405,21 +439,137 @@ def full_cross_join_on_two_variables_query():
             .group_by(sq.c.recipe_name, Ingredient.ingredient_name, date_sq.c.date,)
             .order_by(sq.c.recipe_name, date_sq.c.date, Ingredient.ingredient_name)
     )
-    df = pd.DataFrame(q)
+    q = filter_names(q, sq.c.recipe_name, Ingredient.ingredient_name, recipes, ingredients)
     return q
 
 
+def full_cross_join_on_two_variables_frames(
+    session, batch_size=10000, query=full_cross_join_on_two_variables_query
+):
+    """
+    The report from query(session) streamed as DataFrame chunks of batch_size
+    rows, for reports too large to hold in memory at once.
+    """
+    return stream_frames(query(session), batch_size)
+
+
 # endregion
 
-df = pd.DataFrame(full_cross_join_on_two_variables_query())
-pivot_df = pd.pivot_table(
-    df, index=["recipe_name", "ingredient_name"], columns=["date"], values=["quantity"]
-).reset_index()
-pass
-# region cleanup
+# region Left join densification
+
+
+def grid_left_join_on_two_variables_query(
+    session, dates=None, recipes=None, ingredients=None, use_summary=False
+):
+    """
+    Same output as full_cross_join_on_two_variables_query() without
+    multiplying every executed recipe row by the dates and ingredients.
+
+    Grid - every (recipe, date, ingredient) once, recipes x dates x ingredients
+    ┌─────────────┬──────┬─────────────────┐
+    │ recipe_name │ date │ ingredient_name │
+    ├─────────────┼──────┼─────────────────┤
+    │ Cake        │ 1/1  │ Milk            │
+    │ Cake        │ 1/1  │ Eggs            │
+    │ ...         │ ...  │ ...             │
+    │ Cake        │ 1/4  │ Salt            │
+    └─────────────┴──────┴─────────────────┘
+
+    Facts - executed quantities summed per (recipe, date, ingredient)
+    ┌─────────────┬──────┬─────────────────┬──────────┐
+    │ recipe_name │ date │ ingredient_name │ quantity │
+    ├─────────────┼──────┼─────────────────┼──────────┤
+    │ Cake        │ 1/1  │ Milk            │      200 │
+    │ Cake        │ 1/1  │ Eggs            │      100 │
+    └─────────────┴──────┴─────────────────┴──────────┘
+
+    Grid LEFT JOIN Facts, a missing fact is a quantity of 0. The work is the
+    size of the grid plus the size of the facts rather than their product.
+    """
+    if dates is None:
+        dates = a_time_data_as_query(session)
+    date_sq = dates.subquery()
+    recipe_sq = (
+        session.query(Recipe.recipe_name)
+            .select_from(ExecutedRecipe)
+            .join(Recipe, ExecutedRecipe.recipe)
+            .distinct()
+    ).subquery()
+    ingredient_sq = session.query(Ingredient.ingredient_name).distinct().subquery()
+    executed_sq = executed_quantities_query(session, use_summary).subquery()
+    fact_sq = (
+        session.query(
+            executed_sq.c.recipe_name,
+            executed_sq.c.ingredient_used.label("ingredient_name"),
+            executed_sq.c.date,
+            func.sum(executed_sq.c.quantity).label("quantity"),
+        )
+            .group_by(
+                executed_sq.c.recipe_name,
+                executed_sq.c.ingredient_used,
+                executed_sq.c.date,
+            )
+    ).subquery()
+
+    q = (
+        session.query(
+            recipe_sq.c.recipe_name,
+            ingredient_sq.c.ingredient_name,
+            date_sq.c.date,
+            func.coalesce(fact_sq.c.quantity, 0).label("quantity"),
+        )
+            .select_from(recipe_sq)
+            .join(date_sq, literal(True))
+            .join(ingredient_sq, literal(True))
+            .outerjoin(
+                fact_sq,
+                and_(
+                    fact_sq.c.recipe_name == recipe_sq.c.recipe_name,
+                    fact_sq.c.ingredient_name == ingredient_sq.c.ingredient_name,
+                    fact_sq.c.date == date_sq.c.date,
+                ),
+            )
+            .order_by(
+                recipe_sq.c.recipe_name, date_sq.c.date, ingredient_sq.c.ingredient_name
+            )
+    )
+    q = filter_names(
+        q, recipe_sq.c.recipe_name, ingredient_sq.c.ingredient_name, recipes, ingredients
+    )
+    return q
 
-session.query(Recipe).delete()
-session.query(Ingredient).delete()
-session.commit()
 
 # endregion
+
+
+def run_example():
+    import pandas as pd
+    from core.columnar import fetch_frame
+    from orm.queries.pivot import pivot_frame
+
+    engine = get_engine()
+    create_schema(engine)
+    session = Session(bind=engine)
+    clear_data(session)
+    seed_data(session)
+
+    # built column by column, without a Row object per result row
+    df = fetch_frame(session, full_cross_join_on_two_variables_query(session))
+    pivot_df = pd.pivot_table(
+        df,
+        index=["recipe_name", "ingredient_name"],
+        columns=["date"],
+        values=["quantity"],
+    ).reset_index()
+    print(pivot_df)
+
+    # the same matrix pivoted by the database
+    print(pivot_frame(session))
+
+    # region cleanup
+    clear_data(session)
+    # endregion
+
+
+if __name__ == "__main__":
+    run_example()
@@ -0,0 +1,168 @@
+"""
+Date spine - one row per date from start to end (inclusive) every step.
+
+Building the dates as a UNION ALL of one literal select per date makes the
+statement grow with the range, it takes longer to plan and can't be reused.
+Here start, end and step are bound parameters so the statement is the same
+size for a week or a decade:
+
+- postgresql  start + n * step for n in generate_series(0, steps)
+- sqlite      recursive CTE counting n, date(start, n * step || ' months')
+- otherwise   UNION ALL of bound dates computed in python (grows with range,
+              VALUES in FROM isn't portable: MySQL wants VALUES ROW(...),
+              Oracle has none)
+
+A range with start after end is an empty spine everywhere.
+
+The parameters are named spine_start, spine_end and spine_step so a compiled
+spine can be executed again with other dates.
+
+A spine given an origin steps from origin and keeps the dates from start on
+(the parameter spine_from), so a range cut out of a longer spine holds the
+same dates as the longer spine - monthly steps from the 31st clamp to shorter
+months, a spine restarted on the 30th would step on the 30th.
+
+step is a datetime.timedelta or an interval string such as "1 day",
+"2 weeks" or "1 month". Each date is n steps from start, not one step from the
+date before, and clamped to the end of shorter months as postgres clamps
+dates: monthly from 01-31 is 02-29, 03-31, 04-30 everywhere.
+"""
+import datetime as dt
+import re
+
+from sqlalchemy import Date, Integer, cast, func, select, union_all
+from sqlalchemy import bindparam, case, column, extract, false, literal
+from sqlalchemy import literal_column
+
+_INTERVAL = re.compile(r"^\s*(\d+)\s*(day|week|month|year)s?\s*$")
+
+
+def parse_step(step):
+    """
+    (count, unit) for a timedelta or interval string, unit being day or month.
+    """
+    if isinstance(step, dt.timedelta):
+        if step.days < 1 or step.seconds or step.microseconds:
+            raise ValueError("step must be a whole number of days")
+        return step.days, "day"
+    match = _INTERVAL.match(step)
+    if not match:
+        raise ValueError(f"can't parse step {step!r}")
+    count, unit = int(match.group(1)), match.group(2)
+    if unit == "week":
+        return count * 7, "day"
+    if unit == "year":
+        return count * 12, "month"
+    return count, unit
+
+
+def _add(date, count, unit):
+    if unit == "day":
+        return date + dt.timedelta(days=count)
+    month = date.month - 1 + count
+    year = date.year + month // 12
+    # clamp to the end of shorter months as postgres does
+    day = date.day
+    while True:
+        try:
+            return dt.date(year, month % 12 + 1, day)
+        except ValueError:
+            day -= 1
+
+
+def iter_dates(start, end, step="1 day"):
+    """
+    The dates of the spine, computed in python.
+    """
+    count, unit = parse_step(step)
+    n = 0
+    date = start
+    while date <= end:
+        yield date
+        n += 1
+        date = _add(start, count * n, unit)
+
+
+def _postgresql_spine(start, end, count, unit):
+    first = cast(bindparam("spine_start", start, type_=Date), Date)
+    last = cast(bindparam("spine_end", end, type_=Date), Date)
+    step = bindparam("spine_step", count, type_=Integer)
+    # each date is counted from start, generate_series(start, end, step) adds
+    # the step to the previous date, so months clamped once stay clamped
+    if unit == "day":
+        steps = (last - first) / step
+    else:
+        steps = cast(
+            (extract("year", last) - extract("year", first)) * 12
+            + extract("month", last)
+            - extract("month", first),
+            Integer,
+        ) / step
+    n = column("n", Integer)
+    date = cast(first + n * step * literal_column(f"interval '1 {unit}'"), Date)
+    series = func.generate_series(0, steps).alias("n")
+    return select([date.label("date")]).select_from(series).where(date <= last)
+
+
+def _sqlite_date(first, offset, unit):
+    """
+    first plus offset days or months, clamped to the end of shorter months
+    like _add(). sqlite's date() overflows: 01-31 +1 month is 03-02.
+    """
+    # || binds tighter than * in sqlite
+    offset = offset.self_group()
+    if unit == "day":
+        return func.date(first, offset.concat(" days"), type_=Date)
+    date = func.date(first, offset.concat(" months"))
+    month_end = func.date(
+        first, "start of month", (offset + 1).self_group().concat(" months"), "-1 day"
+    )
+    day = func.strftime("%d", first)
+    return case([(func.strftime("%d", date) == day, date)], else_=month_end)
+
+
+def _sqlite_spine(start, end, count, unit):
+    first = bindparam("spine_start", start, type_=Date)
+    last = bindparam("spine_end", end, type_=Date)
+    step = bindparam("spine_step", count, type_=Integer)
+    # n counts the steps, each date is counted from start not the previous
+    # date so months clamped once stay clamped
+    spine = (
+        select([literal(0, Integer).label("n"), first.label("date")])
+        .where(first <= last)
+        .cte("spine", recursive=True)
+    )
+    next_date = _sqlite_date(first, (spine.c.n + 1) * step, unit)
+    spine = spine.union_all(
+        select([spine.c.n + 1, next_date]).where(next_date <= last)
+    )
+    return select([spine.c.date])
+
+
+def _union_all_spine(start, end, count, unit):
+    dates = list(iter_dates(start, end, f"{count} {unit}"))
+    if not dates:
+        return select([literal(start, Date).label("date")]).where(false())
+    return union_all(*[select([literal(date, Date).label("date")]) for date in dates])
+
+
+def date_spine(session, start, end, step="1 day", name="dates", origin=None):
+    """
+    A selectable with a single "date" column, one row per date of the spine,
+    in the best form the session's database supports. With origin the dates
+    are those of the spine from origin, from start to end.
+    """
+    count, unit = parse_step(step)
+    first = start if origin is None else origin
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        spine = _postgresql_spine(first, end, count, unit)
+    elif dialect == "sqlite":
+        spine = _sqlite_spine(first, end, count, unit)
+    else:
+        spine = _union_all_spine(first, end, count, unit)
+    if origin is not None:
+        spine = spine.alias("spine_dates")
+        since = bindparam("spine_from", start, type_=Date)
+        spine = select([spine.c.date]).where(spine.c.date >= since)
+    return spine.alias(name)
@@ -0,0 +1,207 @@
+"""
+Parallel partitioned reports
+
+A two variable report is one statement, run by one database backend on one
+CPU. parallel_report() splits it into partitions which the database can
+run side by side:
+
+- by="date"    contiguous ranges of the date spine, each stepped from the
+               report's start so they hold the report's dates
+- by="recipe"  contiguous runs of the ordered recipe names, bound through
+               the reports' recipes filter
+
+The partitions are executed by workers threads, each on its own pooled
+connection, or with processes=True by worker processes with their own engines
+(get_engine() is fork aware), which also spreads the python side of building
+rows over CPUs. Each partition runs the same statement shape, so it is
+compiled once via cached_report(). More partitions than workers evens out
+uneven partitions, more workers than the pool or the database has connections
+or cores for only queues.
+
+The partial results are merged back into the report's order (recipe, date,
+ingredient) as a DataFrame, or with output="array" a dense recipes x
+ingredients x dates array as returned by orm.queries.sparse.dense_array().
+"""
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from sqlalchemy.orm import Session
+
+from engine import get_engine
+from orm.queries.cross_join import full_cross_join_on_two_variables_query
+from orm.queries.date_spine import iter_dates
+from orm.queries.pivot import DEFAULT_START, DEFAULT_END
+from orm.queries.sparse import recipe_names_query
+from orm.queries.statement_cache import cached_report
+
+COLUMNS = ["recipe_name", "ingredient_name", "date", "quantity"]
+
+
+def _chunks(values, count):
+    """
+    values split into at most count contiguous, near equal, non empty chunks.
+    """
+    size, extra = divmod(len(values), count)
+    chunks = []
+    start = 0
+    for i in range(count):
+        end = start + size + (i < extra)
+        if end > start:
+            chunks.append(values[start:end])
+        start = end
+    return chunks
+
+
+def recipe_names(session, recipes=None):
+    """
+    The names of the report's recipes in the database's order.
+    """
+    names = [row[0] for row in recipe_names_query(session)]
+    if recipes is not None:
+        wanted = set(recipes)
+        names = [name for name in names if name in wanted]
+    return names
+
+
+def partitions(session, by, count, start, end, step, recipes=None):
+    """
+    (start, end, recipes) of each partition, in report order.
+    """
+    if by == "date":
+        dates = list(iter_dates(start, end, step))
+        return [(chunk[0], chunk[-1], recipes) for chunk in _chunks(dates, count)]
+    if by == "recipe":
+        # in the database's order, the partitions follow each other in the report
+        names = recipe_names(session, recipes)
+        return [(start, end, chunk) for chunk in _chunks(names, count)]
+    raise ValueError(f"can't partition by {by!r}")
+
+
+def run_partition(
+    report, start, end, step, recipes, ingredients, engine=None, origin=None
+):
+    """
+    One partition of report as a DataFrame. Run by the workers, engine None
+    meaning the worker process's own get_engine(), origin the report's start
+    the dates are stepped from.
+    """
+    import pandas as pd
+
+    session = Session(bind=engine or get_engine())
+    try:
+        rows = cached_report(
+            session, report, start, end, step, recipes, ingredients, origin=origin
+        )
+    finally:
+        session.close()
+    return pd.DataFrame.from_records(rows, columns=COLUMNS)
+
+
+def merge(frames, recipe_names=None):
+    """
+    The partial frames, each in report order, as one frame in report order.
+
+    Date partitions (recipe_names given, in the database's order) each hold a
+    date range of every recipe: the rows of each recipe are concatenated from
+    every partition in turn. Recipe partitions already follow each other.
+    """
+    import pandas as pd
+
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    if recipe_names is None:
+        return pd.concat(frames, ignore_index=True)
+    # each partition is contiguous per recipe, in the database's collation -
+    # never re-sort the names in python, its order differs from the database's
+    pieces = {}
+    for frame in frames:
+        for name, rows in frame.groupby("recipe_name", sort=False):
+            pieces.setdefault(name, []).append(rows)
+    ordered = [piece for name in recipe_names for piece in pieces.pop(name, [])]
+    if pieces:
+        raise ValueError(f"recipes missing from the recipe list: {sorted(pieces)}")
+    return pd.concat(ordered, ignore_index=True)
+
+
+def to_array(frame):
+    """
+    (recipes, ingredients, dates, values) of a merged dense report, values
+    indexed [recipe, ingredient, date].
+    """
+    # order of first appearance is the report's (the database's collation)
+    recipes = list(frame["recipe_name"].unique())
+    dates = list(frame["date"].unique())
+    ingredients = list(frame["ingredient_name"].unique())
+    shape = (len(recipes), len(dates), len(ingredients))
+    values = frame["quantity"].to_numpy(dtype=float).reshape(shape)
+    return recipes, ingredients, dates, values.transpose(0, 2, 1)
+
+
+def parallel_report(
+    session,
+    start=DEFAULT_START,
+    end=DEFAULT_END,
+    step="1 month",
+    by="date",
+    partition_count=4,
+    workers=4,
+    processes=False,
+    output="frame",
+    recipes=None,
+    ingredients=None,
+    report=full_cross_join_on_two_variables_query,
+):
+    """
+    report (a two variable report) split into partition_count partitions and
+    run by workers threads, or processes, then merged.
+
+    session is only used to find the partitions, and the engine the threads
+    use. Returns a DataFrame, or with output="array" (recipes, ingredients,
+    dates, values).
+    """
+    parts = partitions(session, by, partition_count, start, end, step, recipes)
+    if processes:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        engine = None
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        engine = session.get_bind()
+    with executor:
+        futures = [
+            executor.submit(
+                run_partition,
+                report,
+                part_start,
+                part_end,
+                step,
+                part_recipes,
+                ingredients,
+                engine,
+                start,
+            )
+            for part_start, part_end, part_recipes in parts
+        ]
+        frames = [future.result() for future in futures]
+
+    frame = merge(frames, recipe_names(session, recipes) if by == "date" else None)
+    if output == "array":
+        return to_array(frame)
+    return frame
+
+
+def run_example():
+    from orm.queries.cross_join import create_schema, clear_data, seed_data
+
+    engine = get_engine()
+    create_schema(engine)
+    session = Session(bind=engine)
+    clear_data(session)
+    seed_data(session)
+
+    print(parallel_report(session, by="date", partition_count=2, workers=2))
+    print(parallel_report(session, by="recipe", partition_count=2, output="array"))
+
+    clear_data(session)
+
+
+if __name__ == "__main__":
+    run_example()
@@ -0,0 +1,153 @@
+"""
+Pivoted recipe report - the recipe/ingredient x date matrix computed by the
+database rather than by pd.pivot_table on the long, dense report.
+
+One row per (recipe, ingredient), one column per date, built with conditional
+aggregation:
+
+    SUM(CASE WHEN date = :pivot_date_0 THEN quantity ELSE 0 END) AS "2020-01-01"
+
+so only len(recipes x ingredients) rows of len(dates) numbers come back
+instead of len(recipes x ingredients x dates) rows of four columns. (crosstab
+would do the same on postgres but needs the tablefunc extension.)
+
+PostgreSQL allows at most 1664 columns in a select list, pivot_query() takes
+at most MAX_PIVOT_DATES dates and pivot_array() / pivot_frame() run longer
+ranges as several statements.
+
+┌─────────────┬─────────────────┬────────────┬────────────┬─────┐
+│ recipe_name │ ingredient_name │ 2020-01-01 │ 2020-02-01 │ ... │
+├─────────────┼─────────────────┼────────────┼────────────┼─────┤
+│ Cake        │ Baking Soda     │          0 │          0 │ ... │
+│ Cake        │ Eggs            │        100 │          0 │ ... │
+│ ...         │ ...             │        ... │        ... │ ... │
+└─────────────┴─────────────────┴────────────┴────────────┴─────┘
+"""
+import datetime as dt
+
+from sqlalchemy import func, literal, case, and_, bindparam, Date
+
+from orm.models import Recipe, Ingredient, ExecutedRecipe
+from orm.queries.date_spine import iter_dates
+
+DEFAULT_START = dt.date(year=2020, month=1, day=1)
+DEFAULT_END = dt.date(year=2020, month=4, day=1)
+
+# postgresql's target list limit less the recipe and ingredient columns
+MAX_PIVOT_DATES = 1664 - 2
+
+
+def pivot_query(session, dates):
+    """
+    The pivot for a list of 1 to MAX_PIVOT_DATES dates, ordered by recipe
+    then ingredient.
+    """
+    dates = list(dates)
+    if not dates:
+        raise ValueError("pivot_query() needs at least one date")
+    if len(dates) > MAX_PIVOT_DATES:
+        raise ValueError(
+            f"pivot_query() takes at most {MAX_PIVOT_DATES} dates, not {len(dates)}"
+        )
+    recipe_sq = (
+        session.query(Recipe.recipe_name)
+        .select_from(ExecutedRecipe)
+        .join(Recipe, ExecutedRecipe.recipe)
+        .distinct()
+    ).subquery()
+    ingredient_sq = session.query(Ingredient.ingredient_name).distinct().subquery()
+    fact_sq = (
+        session.query(
+            Recipe.recipe_name,
+            Ingredient.ingredient_name,
+            ExecutedRecipe.date,
+            ExecutedRecipe.quantity,
+        )
+        .select_from(ExecutedRecipe)
+        .join(Ingredient, ExecutedRecipe.ingredient)
+        .join(Recipe, ExecutedRecipe.recipe)
+        .filter(ExecutedRecipe.date.between(min(dates), max(dates)))
+    ).subquery()
+
+    date_columns = [
+        func.coalesce(
+            func.sum(
+                case(
+                    [
+                        (
+                            fact_sq.c.date
+                            == bindparam(f"pivot_date_{i}", date, type_=Date),
+                            fact_sq.c.quantity,
+                        )
+                    ],
+                    else_=0,
+                )
+            ),
+            0,
+        ).label(date.isoformat())
+        for i, date in enumerate(dates)
+    ]
+
+    q = (
+        session.query(
+            recipe_sq.c.recipe_name, ingredient_sq.c.ingredient_name, *date_columns
+        )
+        .select_from(recipe_sq)
+        .join(ingredient_sq, literal(True))
+        .outerjoin(
+            fact_sq,
+            and_(
+                fact_sq.c.recipe_name == recipe_sq.c.recipe_name,
+                fact_sq.c.ingredient_name == ingredient_sq.c.ingredient_name,
+            ),
+        )
+        .group_by(recipe_sq.c.recipe_name, ingredient_sq.c.ingredient_name)
+        .order_by(recipe_sq.c.recipe_name, ingredient_sq.c.ingredient_name)
+    )
+    return q
+
+
+def pivot_array(session, start=DEFAULT_START, end=DEFAULT_END, step="1 month"):
+    """
+    The pivot as numpy arrays.
+
+    Returns (keys, dates, values) - keys a list of (recipe_name,
+    ingredient_name) row labels, dates the column labels and values a
+    len(keys) x len(dates) float array. An empty date range (start after end)
+    is no keys, no dates and an empty array.
+    """
+    import numpy as np
+
+    dates = list(iter_dates(start, end, step))
+    if not dates:
+        return [], [], np.zeros((0, 0))
+
+    keys = None
+    blocks = []
+    for i in range(0, len(dates), MAX_PIVOT_DATES):
+        chunk = dates[i : i + MAX_PIVOT_DATES]
+        rows = pivot_query(session, chunk).all()
+        # every statement has a row per (recipe, ingredient) in the same order
+        if keys is None:
+            keys = [(row[0], row[1]) for row in rows]
+        blocks.append(
+            np.array([row[2:] for row in rows], dtype=float).reshape(
+                len(rows), len(chunk)
+            )
+        )
+    return keys, dates, np.hstack(blocks)
+
+
+def pivot_frame(session, start=DEFAULT_START, end=DEFAULT_END, step="1 month"):
+    """
+    The pivot as a DataFrame indexed by recipe_name and ingredient_name with a
+    column per date.
+    """
+    import pandas as pd
+
+    keys, dates, values = pivot_array(session, start, end, step)
+    index = pd.MultiIndex.from_arrays(
+        [[key[0] for key in keys], [key[1] for key in keys]],
+        names=["recipe_name", "ingredient_name"],
+    )
+    return pd.DataFrame(values, index=index, columns=pd.Index(dates, name="date"))
@@ -0,0 +1,167 @@
+"""
+Sparse densification - fill the zeros client side.
+
+The cross join reports exist to give a quantity, mostly 0, for every
+(recipe, ingredient, date). Rather than have the database build and ship
+every one of those rows, fetch
+
+- the dimension keys: recipe names, ingredient names, the dates
+- the non zero facts: summed quantity per (recipe, ingredient, date)
+
+and scatter the facts into a preallocated numpy array indexed by
+[recipe, ingredient, date]. Transfer and database work are proportional to
+the facts rather than to recipes x ingredients x dates.
+
+sparse=True returns a scipy.sparse matrix instead, scipy being an optional
+dependency needed for that only.
+"""
+from sqlalchemy import func
+
+from orm.models import Recipe, Ingredient, ExecutedRecipe
+from orm.queries.date_spine import iter_dates
+from orm.queries.pivot import DEFAULT_START, DEFAULT_END
+
+
+def recipe_names_query(session):
+    """
+    Sorted names of the executed recipes.
+    """
+    return (
+        session.query(Recipe.recipe_name)
+        .select_from(ExecutedRecipe)
+        .join(Recipe, ExecutedRecipe.recipe)
+        .distinct()
+        .order_by(Recipe.recipe_name)
+    )
+
+
+def ingredient_names_query(session):
+    return (
+        session.query(Ingredient.ingredient_name)
+        .distinct()
+        .order_by(Ingredient.ingredient_name)
+    )
+
+
+def dimension_keys(session, start=DEFAULT_START, end=DEFAULT_END, step="1 month"):
+    """
+    Sorted recipe names (of executed recipes), ingredient names and dates.
+    """
+    recipes = [row[0] for row in recipe_names_query(session)]
+    ingredients = [row[0] for row in ingredient_names_query(session)]
+    dates = list(iter_dates(start, end, step))
+    return recipes, ingredients, dates
+
+
+def sparse_facts_query(session, start=DEFAULT_START, end=DEFAULT_END):
+    """
+    Summed quantity per (recipe, ingredient, date) which has one.
+    """
+    return (
+        session.query(
+            Recipe.recipe_name,
+            Ingredient.ingredient_name,
+            ExecutedRecipe.date,
+            func.sum(ExecutedRecipe.quantity).label("quantity"),
+        )
+        .select_from(ExecutedRecipe)
+        .join(Ingredient, ExecutedRecipe.ingredient)
+        .join(Recipe, ExecutedRecipe.recipe)
+        .filter(ExecutedRecipe.date.between(start, end))
+        .group_by(Recipe.recipe_name, Ingredient.ingredient_name, ExecutedRecipe.date)
+    )
+
+
+def dense_array(
+    session, start=DEFAULT_START, end=DEFAULT_END, step="1 month", sparse=False
+):
+    """
+    The report as a len(recipes) x len(ingredients) x len(dates) array.
+
+    Returns (recipes, ingredients, dates, values). With sparse=True values is
+    a scipy.sparse COO matrix of shape (len(recipes) * len(ingredients),
+    len(dates)) instead, row r * len(ingredients) + i being recipe r and
+    ingredient i.
+    """
+    if sparse:
+        # fail before running the queries
+        _coo_matrix()
+    recipes, ingredients, dates = dimension_keys(session, start, end, step)
+    facts = sparse_facts_query(session, start, end)
+    values = scatter(recipes, ingredients, dates, facts, sparse)
+    return recipes, ingredients, dates, values
+
+
+def _coo_matrix():
+    try:
+        from scipy.sparse import coo_matrix
+    except ImportError:
+        raise ImportError(
+            "sparse=True needs scipy, install it (pip install scipy) or leave "
+            "sparse=False for a dense numpy array"
+        ) from None
+    return coo_matrix
+
+
+def scatter(recipes, ingredients, dates, facts, sparse=False):
+    """
+    Scatter (recipe_name, ingredient_name, date, quantity) facts into the
+    len(recipes) x len(ingredients) x len(dates) array, a COO matrix with
+    sparse=True (see dense_array()).
+    """
+    import numpy as np
+
+    coo_matrix = _coo_matrix() if sparse else None
+    recipe_index = {name: i for i, name in enumerate(recipes)}
+    ingredient_index = {name: i for i, name in enumerate(ingredients)}
+    date_index = {date: i for i, date in enumerate(dates)}
+
+    facts = [
+        (
+            recipe_index[recipe_name],
+            ingredient_index[ingredient_name],
+            date_index[date],
+            quantity,
+        )
+        for recipe_name, ingredient_name, date, quantity in facts
+        # facts between spine dates are not part of the report
+        if date in date_index
+    ]
+    if facts:
+        r, i, d, quantity = (np.array(column) for column in zip(*facts))
+    else:
+        r = i = d = np.array([], dtype=int)
+        quantity = np.array([], dtype=float)
+
+    shape = (len(recipes), len(ingredients), len(dates))
+    if sparse:
+        return coo_matrix(
+            (quantity, (r * len(ingredients) + i, d)),
+            shape=(shape[0] * shape[1], shape[2]),
+        )
+    values = np.zeros(shape, dtype=float)
+    values[r, i, d] = quantity
+    return values
+
+
+def dense_frame(session, start=DEFAULT_START, end=DEFAULT_END, step="1 month"):
+    """
+    The same long format rows as full_cross_join_on_two_variables_query(),
+    recipe_name, ingredient_name, date, quantity ordered by recipe, date and
+    ingredient, densified client side.
+    """
+    import numpy as np
+    import pandas as pd
+
+    recipes, ingredients, dates, values = dense_array(session, start, end, step)
+    # reorder to recipe, date, ingredient so a flat walk matches the report order
+    ordered = values.transpose(0, 2, 1)
+    r, d, i = np.indices(ordered.shape).reshape(3, -1)
+    return pd.DataFrame(
+        {
+            "recipe_name": np.array(recipes, dtype=object)[r],
+            "ingredient_name": np.array(ingredients, dtype=object)[i],
+            "date": np.array(dates, dtype=object)[d],
+            "quantity": ordered.reshape(-1),
+        }
+    )
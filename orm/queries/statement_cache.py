@@ -0,0 +1,131 @@
+"""
+Compiled statement cache for the reports.
+
+Building a report means nesting several session.query(...).subquery() calls
+and compiling the result to a SQL string, which for small date ranges costs
+as much as running it. The report builders bind everything that varies per
+call - spine_start / spine_end, recipe_names, ingredient_names - as named
+parameters, so two calls which differ only in those values compile to the
+same SQL. cached_report() keeps the compiled form per statement shape in a
+bounded LRU and executes it with the new values. report_cache's counters
+are exported with the statement metrics, see metrics.register_cache().
+"""
+import threading
+from collections import OrderedDict
+
+import metrics
+from orm.queries.cross_join import a_time_data_as_query
+from orm.summary import summary_is_fresh
+
+
+class StatementCache:
+    """
+    Bounded LRU of compiled statements with hit / miss counters.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, build):
+        """
+        The compiled statement for key, calling build() to make it on a miss.
+        """
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        compiled = build()
+        with self._lock:
+            self._entries[key] = compiled
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return compiled
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+report_cache = StatementCache()
+metrics.register_cache("report", report_cache)
+
+
+def cached_report(
+    session,
+    report,
+    start,
+    end,
+    step="1 month",
+    recipes=None,
+    ingredients=None,
+    cache=report_cache,
+    origin=None,
+):
+    """
+    Execute report(session, dates, recipes, ingredients, use_summary) for the
+    dates start to end every step, compiling it only the first time its shape
+    is seen. The summary's freshness is checked once per call. With origin the
+    dates are those stepped from origin, see date_spine().
+
+    report is one of the two variable reports, e.g.
+    grid_left_join_on_two_variables_query. Returns the result rows.
+    """
+    dialect = session.get_bind().dialect
+    fresh = summary_is_fresh(session)
+    key = (
+        report.__module__,
+        report.__qualname__,
+        dialect.name,
+        # drivers render parameters differently (pyformat, qmark, numeric)
+        dialect.driver,
+        str(step),
+        recipes is not None,
+        ingredients is not None,
+        origin is not None,
+        fresh,
+    )
+    if dialect.name not in ("postgresql", "sqlite"):
+        # the fallback spine has a literal per date
+        key += (start, end, origin)
+
+    def build():
+        dates = a_time_data_as_query(session, start, end, step, origin)
+        q = report(
+            session,
+            dates=dates,
+            recipes=recipes,
+            ingredients=ingredients,
+            use_summary=fresh,
+        )
+        return q.statement.compile(dialect=dialect)
+
+    compiled = cache.get(key, build)
+    params = {"spine_start": start, "spine_end": end}
+    if origin is not None:
+        params.update(spine_start=origin, spine_from=start)
+    if recipes is not None:
+        params["recipe_names"] = list(recipes)
+    if ingredients is not None:
+        params["ingredient_names"] = list(ingredients)
+    return session.connection().execute(compiled, params).fetchall()
@@ -0,0 +1,116 @@
+"""
+Read only sessions for reporting
+
+A Session keeps every object it loads in its identity map, snapshots their
+attribute state so it can find the dirty ones and flushes before each query
+(see orm/intro.py steps 3 and 7). A reporting worker which only reads pays for
+all of that per row and gets nothing back.
+
+ReadOnlySession does none of it:
+
+- entity queries return immutable records (orm.records.model_record)
+  holding the column attributes instead of instances - nothing is registered
+  in the identity map and relationships aren't loaded, query them explicitly
+- column queries return rows as usual
+- no autoflush and nothing to expire on commit
+- add / delete / merge / flush, the bulk_* methods, Query.update / delete
+  and executing INSERT / UPDATE / DELETE raise ReadOnlyError
+- the database refuses any other write, text("DELETE ...") included: on
+  postgresql every transaction is started READ ONLY, on sqlite the
+  connection is PRAGMA query_only until the transaction ends
+
+    session = ReadOnlySession(bind=engine)
+    for user in session.query(User).filter(User.name.like("e%")):
+        print(user.id, user.full_name)
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Query, Session
+from sqlalchemy.pool import Pool
+from sqlalchemy.sql.dml import UpdateBase
+
+from orm.records import entity_columns, iter_records
+
+
+class ReadOnlyError(Exception):
+    pass
+
+
+class ReadOnlyQuery(Query):
+    def __iter__(self):
+        if entity_columns(self) is None:
+            return super().__iter__()
+        return iter_records(self)
+
+    def update(self, *args, **kwargs):
+        raise ReadOnlyError("update() on a read only session")
+
+    def delete(self, *args, **kwargs):
+        raise ReadOnlyError("delete() on a read only session")
+
+
+def _refuse(name):
+    def refuse(self, *args, **kwargs):
+        raise ReadOnlyError(f"{name}() on a read only session")
+
+    refuse.__name__ = name
+    return refuse
+
+
+class ReadOnlySession(Session):
+    def __init__(self, bind=None, **kwargs):
+        kwargs.setdefault("autoflush", False)
+        kwargs.setdefault("expire_on_commit", False)
+        kwargs.setdefault("query_cls", ReadOnlyQuery)
+        super().__init__(bind=bind, **kwargs)
+
+    add = _refuse("add")
+    add_all = _refuse("add_all")
+    delete = _refuse("delete")
+    merge = _refuse("merge")
+    bulk_save_objects = _refuse("bulk_save_objects")
+    bulk_insert_mappings = _refuse("bulk_insert_mappings")
+    bulk_update_mappings = _refuse("bulk_update_mappings")
+
+    def flush(self, objects=None):
+        # commit() flushes, there is never anything to write
+        if self.new or self.dirty or self.deleted:
+            raise ReadOnlyError("flush() on a read only session")
+
+    def execute(self, clause, params=None, mapper=None, bind=None, **kw):
+        if isinstance(clause, UpdateBase):
+            raise ReadOnlyError(f"{clause.__visit_name__} on a read only session")
+        return super().execute(clause, params, mapper, bind, **kw)
+
+
+@event.listens_for(ReadOnlySession, "after_begin")
+def _read_only_transaction(session, transaction, connection):
+    if connection.dialect.name == "postgresql":
+        connection.execute("SET TRANSACTION READ ONLY")
+    elif connection.dialect.name == "sqlite":
+        # sqlite has no read only transactions, the pragma holds for the
+        # connection until it is turned off again
+        connection.execute("PRAGMA query_only = ON")
+        connection.connection.info["query_only"] = True
+        session.info.setdefault("query_only", []).append(connection)
+
+
+@event.listens_for(ReadOnlySession, "after_transaction_end")
+def _end_read_only_transaction(session, transaction):
+    if transaction.parent is not None:
+        return
+    for connection in session.info.pop("query_only", ()):
+        # a connection the session was bound to stays open, the others are
+        # back in the pool, see _reset_query_only()
+        if not connection.closed:
+            connection.execute("PRAGMA query_only = OFF")
+            connection.connection.info.pop("query_only", None)
+
+
+@event.listens_for(Pool, "checkin")
+def _reset_query_only(dbapi_connection, connection_record):
+    if dbapi_connection is None or connection_record is None:
+        return
+    if connection_record.info.pop("query_only", False):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only = OFF")
+        cursor.close()
@@ -0,0 +1,260 @@
+"""
+Compact row records
+A result Row carries its values plus references to the result's metadata,
+processors and key map, an ORM instance a __dict__ and an InstanceState with
+its own dicts - hundreds of bytes per row before the values. Holding millions
+of report rows that overhead is most of the memory.
+
+Records are generated immutable classes with __slots__ and nothing else: a
+record of n columns is an object header and n pointers. Attribute access is a
+slot descriptor, as fast as on any class, and they still behave like a row -
+index, unpack, compare, hash, _asdict():
+
+    UserRecord = model_record(User)         # id, name, full_name
+    Point = record_type("Point", ["x", "y"])
+
+Queries hydrate straight into them, a batch of result rows at a time, and
+only the records are kept:
+
+    for user in iter_records(session.query(User.full_name, User.id)):
+        print(user.full_name, user.id)
+    rows = fetch_records(full_cross_join_on_two_variables_query(session))
+
+Entity queries give model records (relationships are not loaded), several
+entities per row a tuple of records. With intern=True the names and dates
+repeated on every row of a report are shared rather than held once per row.
+"""
+import datetime as dt
+import keyword
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Query
+
+
+class Record:
+    """
+    Base of the generated record classes.
+    """
+
+    __slots__ = ()
+    _fields = ()
+
+    @classmethod
+    def _make(cls, values):
+        return cls(*values)
+
+    def _astuple(self):
+        return tuple(getattr(self, field) for field in self._fields)
+
+    def _asdict(self):
+        return {field: getattr(self, field) for field in self._fields}
+
+    def __iter__(self):
+        return iter(self._astuple())
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __getitem__(self, index):
+        return self._astuple()[index]
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return type(self) is type(other) and self._astuple() == other._astuple()
+        if isinstance(other, tuple):
+            return self._astuple() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self._astuple())
+
+    def __repr__(self):
+        values = ", ".join(f"{f}={getattr(self, f)!r}" for f in self._fields)
+        return f"{type(self).__name__}({values})"
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} records are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} records are immutable")
+
+    def __reduce__(self):
+        # generated classes can't be found by name, pickle the recipe instead
+        return _unpickle, (type(self).__name__, self._fields, self._astuple())
+
+
+def _unpickle(name, fields, values):
+    return record_type(name, fields)(*values)
+
+
+_record_types = {}
+
+
+def _field_names(names):
+    """
+    names as attribute names, invalid or repeated ones replaced by _<index>
+    like namedtuple(rename=True).
+    """
+    fields = []
+    for index, name in enumerate(names):
+        if (
+            not name.isidentifier()
+            or keyword.iskeyword(name)
+            or name.startswith("_")
+            or name in fields
+        ):
+            name = f"_{index}"
+        fields.append(name)
+    return tuple(fields)
+
+
+def record_type(name, names):
+    """
+    The record class called name with a slot per name, one class per name and
+    fields.
+    """
+    fields = _field_names(names)
+    cls = _record_types.get((name, fields))
+    if cls is None:
+        cls = type(
+            name,
+            (Record,),
+            {"__slots__": fields, "_fields": fields, "__module__": __name__},
+        )
+        # a generated __init__ filling each slot through its descriptor, as
+        # namedtuple and dataclasses generate theirs - an order faster than a
+        # loop, and past Record.__setattr__ which refuses any later change
+        namespace = {f"_set_{field}": cls.__dict__[field].__set__ for field in fields}
+        arguments = ", ".join(fields)
+        body = "".join(f"    _set_{field}(self, {field})\n" for field in fields)
+        exec(f"def __init__(self, {arguments}):\n{body or '    pass'}\n", namespace)
+        cls.__init__ = namespace["__init__"]
+        _record_types[(name, fields)] = cls
+    return cls
+
+
+def model_record(model):
+    """
+    The record class of a mapped class (or mapper), a field per column
+    attribute in mapper order.
+    """
+    mapper = inspect(model).mapper
+    names = [prop.key for prop in mapper.column_attrs]
+    return record_type(f"{mapper.class_.__name__}Record", names)
+
+
+def _entity_mapper(description):
+    """
+    The mapper of an entity (a mapped or aliased class) of a query, None for
+    a column.
+    """
+    info = inspect(description["expr"], raiseerr=False)
+    if getattr(info, "is_mapper", False) or getattr(info, "is_aliased_class", False):
+        return info.mapper
+    return None
+
+
+def entity_columns(query):
+    """
+    query's entities expanded into their column attributes: (columns, parts)
+    with a (record class, start, end) part per entity and (None, index, None)
+    per column. None when query selects no entity.
+    """
+    descriptions = query.column_descriptions
+    mappers = [_entity_mapper(d) for d in descriptions]
+    if not any(mappers):
+        return None
+    # labelled, a select would only keep one of a column selected twice
+    columns = []
+    parts = []
+    for description, mapper in zip(descriptions, mappers):
+        start = len(columns)
+        expr = description["expr"]
+        if mapper is None:
+            columns.append(expr.label(None))
+            parts.append((None, start, None))
+            continue
+        columns.extend(
+            getattr(expr, prop.key).label(None) for prop in mapper.column_attrs
+        )
+        parts.append((model_record(mapper), start, len(columns)))
+    return columns, parts
+
+
+# the values which repeat across the rows of a report: names, dates
+INTERNED_TYPES = (str, dt.date)
+
+
+def _intern(rows, memos):
+    """
+    rows as columns with one object per distinct string / date value of each
+    column.
+    """
+    columns = []
+    for memo, column in zip(memos, zip(*rows)):
+        shared = memo.setdefault
+        columns.append(
+            [shared(v, v) if isinstance(v, INTERNED_TYPES) else v for v in column]
+        )
+    return columns
+
+
+def iter_records(
+    stmt, bind=None, record=None, name="Record", batch_size=10000, intern=False
+):
+    """
+    Yield the rows of stmt, an ORM query or a Core select, as records.
+
+    bind, an Engine, Connection or Session, defaults to the query's session,
+    which is autoflushed first as when iterating the query. record is the
+    class to hydrate, by default record_type(name, columns) for column
+    queries and model records for entity queries. intern=True shares one
+    object per distinct string / date value between the rows, a dict lookup
+    per value for much less memory on reports whose names and dates repeat
+    on every row.
+    """
+    parts = None
+    if isinstance(stmt, Query):
+        if stmt._autoflush and bind is None:
+            stmt.session._autoflush()
+        bind = bind or stmt.session
+        expanded = entity_columns(stmt)
+        if expanded is not None:
+            columns, parts = expanded
+            stmt = stmt.with_entities(*columns)
+        stmt = stmt.statement
+        if parts is not None and len(parts) == 1:
+            record, parts = parts[0][0], None
+
+    result = bind.execute(stmt)
+    try:
+        keys = result.keys()
+        memos = [{} for _ in keys]
+        if record is None and parts is None:
+            record = record_type(name, keys)
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            if intern:
+                rows = zip(*_intern(rows, memos))
+            if parts is None:
+                for row in rows:
+                    yield record(*row)
+                continue
+            for row in rows:
+                yield tuple(
+                    make(*row[start:end]) if make else row[start]
+                    for make, start, end in parts
+                )
+    finally:
+        result.close()
+
+
+def fetch_records(
+    stmt, bind=None, record=None, name="Record", batch_size=10000, intern=False
+):
+    """
+    Every row of stmt as a list of records, see iter_records().
+    """
+    return list(iter_records(stmt, bind, record, name, batch_size, intern))
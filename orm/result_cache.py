@@ -0,0 +1,331 @@
+"""
+Query result cache
+
+An opt-in cache for Session queries, in the style of SQLAlchemy's dogpile
+caching example. Sessions are created with CachingQuery as their query
+class and individual queries ask for caching:
+
+    cache = ResultCache(MemoryBackend(maxsize=1000), ttl=300)
+    session = Session(bind=engine, query_cls=CachingQuery)
+    cache.listen(session)
+
+    session.query(User).filter_by(name="ed").from_cache(cache).all()
+
+Results are keyed on the database url, the compiled SQL and its parameters,
+and expire after ttl seconds. Every entry records a generation token for
+each table the query reads, a flush (or bulk update / delete) writing to a
+table replaces that table's token, so every cached result reading it is
+invalid from then on. So do the INSERT / UPDATE / DELETE / TRUNCATE
+statements executed through the session's connections, orm.bulk's
+bulk_insert(), bulk_update(), bulk_delete() and truncate() given the session.
+Core writes made outside the session are picked up with
+cache.listen_engine(engine). COPY through the raw DBAPI cursor is not seen,
+invalidate() those tables by hand.
+
+Backends are anything with get(key), set(key, value) and delete(key), values
+being bytes. MemoryBackend is a bounded in-process LRU, MappingBackend wraps
+any mapping - a dict, or shelve.open(path) for a file backed stand in for an
+external store. Entries are pickled, and unpickling runs code: a backend not
+marked trusted (MappingBackend by default) needs a secret, every entry is
+signed with it and one whose signature doesn't match is dropped unread:
+
+    cache = ResultCache(MappingBackend(shelve.open(path)), secret=key)
+"""
+import hashlib
+import hmac
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import event, Table
+from sqlalchemy.orm import Query, object_mapper
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.util import find_tables
+
+from orm.bulk import Truncate
+
+
+class MemoryBackend:
+    """
+    Bounded in-process LRU.
+    """
+
+    trusted = True
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class MappingBackend:
+    """
+    Any mutable mapping of str to bytes as a backend, trusted only when only
+    this process can write to it.
+    """
+
+    def __init__(self, mapping, trusted=False):
+        self.mapping = mapping
+        self.trusted = trusted
+
+    def get(self, key):
+        return self.mapping.get(key)
+
+    def set(self, key, value):
+        self.mapping[key] = value
+
+    def delete(self, key):
+        self.mapping.pop(key, None)
+
+
+SIGNATURE_SIZE = hashlib.sha256().digest_size
+
+
+def _generation_key(table):
+    return f"generation:{table}"
+
+
+def _tables_written(clauseelement):
+    """
+    The names of the tables an executed statement writes to.
+    """
+    if isinstance(clauseelement, UpdateBase):
+        return [clauseelement.table.name]
+    if isinstance(clauseelement, Truncate):
+        return [table.name for table in clauseelement.tables]
+    return []
+
+
+class ResultCache:
+    def __init__(self, backend=None, ttl=300, secret=None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        if secret is None and not getattr(self.backend, "trusted", False):
+            raise ValueError("an untrusted backend needs a secret to sign entries")
+        self.ttl = ttl
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # region generations
+
+    def _generation(self, table):
+        value = self.backend.get(_generation_key(table))
+        return value.decode() if value is not None else None
+
+    def invalidate(self, *tables):
+        """
+        Invalidate every cached result reading any of tables (names).
+        """
+        for table in tables:
+            self.backend.set(_generation_key(table), uuid.uuid4().hex.encode())
+
+    # endregion
+
+    # region entries
+
+    def _dumps(self, entry):
+        data = pickle.dumps(entry)
+        if self.secret is None:
+            return data
+        return hmac.new(self.secret, data, hashlib.sha256).digest() + data
+
+    def _loads(self, raw):
+        """
+        The entry in raw, None when its signature doesn't match.
+        """
+        if self.secret is not None:
+            signature, raw = raw[:SIGNATURE_SIZE], raw[SIGNATURE_SIZE:]
+            expected = hmac.new(self.secret, raw, hashlib.sha256).digest()
+            if not hmac.compare_digest(signature, expected):
+                return None
+        return pickle.loads(raw)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    # endregion
+
+    def get(self, key):
+        """
+        The cached value for key, None when missing, expired, invalidated or
+        not signed with the secret.
+        """
+        raw = self.backend.get(key)
+        entry = self._loads(raw) if raw is not None else None
+        if entry is None:
+            if raw is not None:
+                self.backend.delete(key)
+            self._count(False)
+            return None
+        expired = entry["expires"] < time.time()
+        stale = any(
+            self._generation(table) != generation
+            for table, generation in entry["generations"].items()
+        )
+        if expired or stale:
+            self.backend.delete(key)
+            self._count(False)
+            return None
+        self._count(True)
+        return entry["value"]
+
+    def set(self, key, value, tables, ttl=None):
+        """
+        Cache value under key as reading tables. The generations are read
+        before the value is computed by the caller, see CachingQuery.
+        """
+        entry = {
+            "expires": time.time() + (self.ttl if ttl is None else ttl),
+            "generations": tables,
+            "value": value,
+        }
+        self.backend.set(key, self._dumps(entry))
+
+    def generations(self, tables):
+        return {table: self._generation(table) for table in tables}
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    # region invalidation events
+
+    def listen(self, target):
+        """
+        Invalidate on writes flushed by target, a Session, sessionmaker or
+        the Session class, and on the statements executed through its
+        connections.
+        """
+        event.listen(target, "after_flush", self._after_flush)
+        event.listen(target, "after_commit", self._after_commit)
+        event.listen(target, "after_bulk_update", self._after_bulk)
+        event.listen(target, "after_bulk_delete", self._after_bulk)
+        event.listen(target, "after_begin", self._after_begin)
+
+    def listen_engine(self, engine):
+        """
+        Invalidate on every INSERT / UPDATE / DELETE executed through engine.
+        """
+        event.listen(engine, "after_execute", self._after_execute)
+
+    def _written(self, session, tables):
+        session.info.setdefault("result_cache_written", set()).update(tables)
+        self.invalidate(*tables)
+
+    def _after_flush(self, session, flush_context):
+        tables = set()
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            tables.update(table.name for table in object_mapper(obj).tables)
+        self._written(session, tables)
+
+    def _after_bulk(self, context):
+        self._written(context.session, [context.primary_table.name])
+
+    def _after_commit(self, session):
+        # a reader in another transaction may have cached the old rows
+        # between the flush and the commit
+        self.invalidate(*session.info.pop("result_cache_written", ()))
+
+    def _after_begin(self, session, transaction, connection):
+        # Core statements on the session's connection (orm.bulk) bypass the
+        # flush events
+        listeners = session.info.setdefault("result_cache_listeners", {})
+        listener = listeners.get(self)
+        if listener is None:
+
+            def listener(conn, clauseelement, multiparams, params, result):
+                # the flush's own statements are invalidated at once in
+                # _after_flush, Session._flushing is reset even if it raises
+                if not session._flushing:
+                    tables = _tables_written(clauseelement)
+                    if tables:
+                        self._written(session, tables)
+
+            listeners[self] = listener
+        if not event.contains(connection, "after_execute", listener):
+            event.listen(connection, "after_execute", listener)
+
+    def _after_execute(self, conn, clauseelement, multiparams, params, result):
+        tables = _tables_written(clauseelement)
+        if tables:
+            self.invalidate(*tables)
+
+    # endregion
+
+
+def _tables_read(statement):
+    return sorted(
+        {
+            table.name
+            for table in find_tables(statement, check_columns=True, include_aliases=True)
+            if isinstance(table, Table)
+        }
+    )
+
+
+class CachingQuery(Query):
+    """
+    Query with from_cache() to serve its results from a ResultCache.
+    """
+
+    _result_cache = None
+    _result_cache_ttl = None
+
+    def from_cache(self, cache, ttl=None):
+        q = self._clone()
+        q._result_cache = cache
+        q._result_cache_ttl = ttl
+        return q
+
+    def cache_key(self):
+        bind = self.session.get_bind()
+        compiled = self.statement.compile(dialect=bind.dialect)
+        params = sorted((key, repr(value)) for key, value in compiled.params.items())
+        # the same query against another database is another result, the
+        # url's repr leaves out the password
+        url = repr(bind.engine.url)
+        return hashlib.sha1(f"{url}{compiled}{params}".encode()).hexdigest()
+
+    def __iter__(self):
+        cache = self._result_cache
+        if cache is None:
+            return super().__iter__()
+
+        key = self.cache_key()
+        cached = cache.get(key)
+        if cached is None:
+            statement = self.statement
+            # generations are read first so a write during the query
+            # invalidates what is about to be cached
+            generations = cache.generations(_tables_read(statement))
+            results = list(super().__iter__())
+            single = len(self._entities) == 1
+            cached = results if single else [tuple(row) for row in results]
+            cache.set(key, cached, generations, self._result_cache_ttl)
+            return iter(results)
+        return iter(self.merge_result(cached, load=False))
@@ -0,0 +1,29 @@
+"""
+Project session factory
+Sessions configured for this project, rather than the behaviour of every
+sqlalchemy Session in the process:
+
+- batched flush (orm.flush), on unless DB_BATCHED_FLUSH=0
+
+    session = new_session()            # bound to get_engine()
+    session = session_factory(bind=engine)
+"""
+import os
+
+from sqlalchemy.orm import sessionmaker
+
+from engine import get_engine
+from orm.flush import enable_batched_flush
+
+BATCHED_FLUSH = os.getenv("DB_BATCHED_FLUSH", "1").lower() in ("1", "true", "yes", "on")
+
+session_factory = sessionmaker()
+if BATCHED_FLUSH:
+    enable_batched_flush(session_factory)
+
+
+def new_session(bind=None, **kwargs):
+    """
+    A session of session_factory, bound to the process wide engine by default.
+    """
+    return session_factory(bind=bind or get_engine(), **kwargs)
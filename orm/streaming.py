@@ -0,0 +1,34 @@
+"""
+Streaming ORM queries
+query.all() and pd.DataFrame(query) load the whole result before returning.
+yield_per() switches the query to a server side cursor (stream_results) and
+builds rows/objects batch_size at a time.
+
+yield_per is not compatible with eager loading of collections
+(joinedload / subqueryload on a one to many), use these on column queries or
+entity queries without collection loaders.
+"""
+from itertools import islice
+
+
+def stream_query(query, batch_size=10000):
+    """
+    Yield lists of at most batch_size results of query.
+    """
+    results = iter(query.yield_per(batch_size))
+    while True:
+        batch = list(islice(results, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
+def stream_frames(query, batch_size=10000):
+    """
+    Yield a pandas DataFrame per batch of a column query.
+    """
+    import pandas as pd
+
+    columns = [description["name"] for description in query.column_descriptions]
+    for batch in stream_query(query, batch_size):
+        yield pd.DataFrame.from_records(batch, columns=columns)
@@ -0,0 +1,132 @@
+"""
+Daily quantity summary
+
+executedrecipe_daily holds the summed quantity per (recipe, ingredient, date)
+so the reports can read one pre-aggregated row per key instead of
+re-aggregating raw executedrecipe rows on every call.
+
+Triggers on executedrecipe (see orm.models) record the date of every insert,
+update and delete in executedrecipe_dirty_date. refresh_summary() claims those
+dates, recomputes only them and records the refresh in summary_refresh. The
+summary is fresh when it has been refreshed at least once and no dates are
+dirty. The query builders don't execute anything: callers check
+summary_is_fresh() once and pass use_summary down to
+executed_quantities_query() and the reports built on it.
+"""
+import datetime as dt
+
+from sqlalchemy import func, select, exists
+
+from orm.models import Recipe, Ingredient, ExecutedRecipe
+from orm.models import DailyQuantity, DirtyDate, SummaryRefresh
+
+SUMMARY_NAME = DailyQuantity.__tablename__
+
+
+def summary_is_fresh(session, start=None, end=None):
+    """
+    True when executedrecipe_daily is up to date for dates start to end
+    (every date when not given).
+    """
+    refreshed = session.query(
+        exists().where(SummaryRefresh.name == SUMMARY_NAME)
+    ).scalar()
+    if not refreshed:
+        return False
+    dirty = session.query(DirtyDate.date)
+    if start is not None:
+        dirty = dirty.filter(DirtyDate.date >= start)
+    if end is not None:
+        dirty = dirty.filter(DirtyDate.date <= end)
+    return not session.query(dirty.exists()).scalar()
+
+
+def _claim_dirty_dates(connection):
+    """
+    Delete and return the dirty dates. Deleting first means a concurrent
+    change to one of them marks it dirty again once this transaction commits.
+    """
+    dirty = DirtyDate.__table__
+    if connection.dialect.name == "postgresql":
+        stmt = dirty.delete().returning(dirty.c.date)
+        return [row.date for row in connection.execute(stmt)]
+    dates = [row.date for row in connection.execute(select([dirty.c.date]))]
+    if dates:
+        connection.execute(dirty.delete().where(dirty.c.date.in_(dates)))
+    return dates
+
+
+def refresh_summary(session, full=False):
+    """
+    Recompute executedrecipe_daily for the dates changed since the last
+    refresh, or for every date with full=True (needed once for a table which
+    had rows before the triggers existed).
+
+    The session's transaction is left open for the caller to commit.
+    Returns the number of dates recomputed, None for a full refresh.
+    """
+    connection = session.connection()
+    daily = DailyQuantity.__table__
+
+    aggregate = select(
+        [
+            ExecutedRecipe.recipe_id,
+            ExecutedRecipe.ingredient_id,
+            ExecutedRecipe.date,
+            func.sum(ExecutedRecipe.quantity),
+        ]
+    ).group_by(
+        ExecutedRecipe.recipe_id, ExecutedRecipe.ingredient_id, ExecutedRecipe.date
+    )
+    columns = ["recipe_id", "ingredient_id", "date", "quantity"]
+
+    if full:
+        _claim_dirty_dates(connection)
+        connection.execute(daily.delete())
+        connection.execute(daily.insert().from_select(columns, aggregate))
+        refreshed = None
+    else:
+        dates = _claim_dirty_dates(connection)
+        if dates:
+            connection.execute(daily.delete().where(daily.c.date.in_(dates)))
+            connection.execute(
+                daily.insert().from_select(
+                    columns, aggregate.where(ExecutedRecipe.date.in_(dates))
+                )
+            )
+        refreshed = len(dates)
+
+    refresh = SummaryRefresh.__table__
+    now = dt.datetime.utcnow()
+    updated = connection.execute(
+        refresh.update().where(refresh.c.name == SUMMARY_NAME).values(refreshed_at=now)
+    )
+    if not updated.rowcount:
+        connection.execute(refresh.insert().values(name=SUMMARY_NAME, refreshed_at=now))
+    return refreshed
+
+
+def executed_quantities_query(session, use_summary=False):
+    """
+    recipe_name, date, ingredient_used, quantity for every executed
+    (recipe, ingredient, date).
+
+    Read from executedrecipe_daily with use_summary=True, the caller having
+    checked summary_is_fresh(), otherwise from the raw executedrecipe rows
+    (several rows per key there, callers sum them).
+    """
+    if use_summary:
+        source = DailyQuantity
+    else:
+        source = ExecutedRecipe
+    return (
+        session.query(
+            Recipe.recipe_name,
+            source.date,
+            Ingredient.ingredient_name.label("ingredient_used"),
+            source.quantity,
+        )
+        .select_from(source)
+        .join(Ingredient, source.ingredient)
+        .join(Recipe, source.recipe)
+    )
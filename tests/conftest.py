@@ -0,0 +1,23 @@
+"""
+Run from the repository root:
+
+    python -m pytest tests
+
+The PostgreSQL tests need a scratch database, TEST_DATABASE_URL
+(postgresql://...), whose tables they create and drop. Without it they are
+skipped.
+"""
+import os
+
+import pytest
+from sqlalchemy import create_engine
+
+
+@pytest.fixture(scope="session")
+def pg_engine():
+    url = os.getenv("TEST_DATABASE_URL", "")
+    if not url.startswith("postgresql"):
+        pytest.skip("TEST_DATABASE_URL is not a postgresql database")
+    engine = create_engine(url)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from orm.models import Recipe
+from orm.queries import async_reports, sparse
+from orm.queries.cross_join import clear_data, create_schema, seed_data
+from orm.queries.cross_join import a_time_data_as_query
+from orm.queries.cross_join import full_cross_join_on_two_variables_query
+from orm.summary import refresh_summary
+
+pytest.importorskip("asyncpg")
+
+
+@pytest.fixture
+def session(pg_engine, monkeypatch):
+    # create_async_engine() reads engine_config()
+    monkeypatch.setenv("DATABASE_URL", str(pg_engine.url))
+    create_schema(pg_engine)
+    session = Session(bind=pg_engine)
+    clear_data(session)
+    seed_data(session)
+    yield session
+    clear_data(session)
+    session.close()
+
+
+def run(coroutine):
+    async def with_session():
+        from async_engine import create_async_engine
+        from orm.async_session import AsyncSession
+
+        engine = await create_async_engine()
+        try:
+            session = AsyncSession(engine)
+            await session.prepare()
+            return await coroutine(session)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(with_session())
+
+
+@pytest.mark.parametrize("refreshed", [False, True])
+def test_report_matches_the_sync_report(session, refreshed):
+    if refreshed:
+        refresh_summary(session)
+        session.commit()
+    dates = a_time_data_as_query(session)
+    q = full_cross_join_on_two_variables_query(session, dates=dates)
+    expected = [tuple(row) for row in q]
+    assert expected
+
+    async def report(async_session):
+        assert async_session.summary_fresh == refreshed
+        return await async_reports.full_cross_join_on_two_variables(async_session)
+
+    rows = run(report)
+    assert [tuple(row) for row in rows] == expected
+
+
+def test_dense_array_matches_the_sync_array(session):
+    recipes, ingredients, dates, values = sparse.dense_array(session)
+
+    result = run(async_reports.dense_array)
+    assert result[:3] == (recipes, ingredients, dates)
+    assert (result[3] == values).all()
+
+
+def test_stream_and_scalar(session):
+    async def read(async_session):
+        q = async_session.query(Recipe.recipe_name).order_by(Recipe.recipe_name)
+        batches = [batch async for batch in async_session.stream(q, batch_size=1)]
+        count = async_session.query(func.count(Recipe.id))
+        return batches, await async_session.scalar(count)
+
+    batches, count = run(read)
+    assert [[tuple(row) for row in batch] for batch in batches] == [
+        [("Cake",)],
+        [("Fried Rice",)],
+    ]
+    assert count == 2
@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table
+from sqlalchemy import cast, func, literal, null, select, union_all
+from sqlalchemy.dialects import postgresql
+
+from core.columnar import arrow_batches, fetch_arrow
+
+pytest.importorskip("pyarrow")
+
+missing = Table("no_such_table", MetaData(), Column("x", Integer))
+
+
+class FailingCursor:
+    def mogrify(self, sql, params):
+        return sql.encode()
+
+    def copy_expert(self, sql, file):
+        raise RuntimeError("COPY failed")
+
+    def close(self):
+        pass
+
+
+class FailingConnection:
+    dialect = postgresql.dialect()
+
+    class connection:
+        @staticmethod
+        def cursor():
+            return FailingCursor()
+
+        @staticmethod
+        def cancel():
+            pass
+
+
+def test_copy_failure_before_output_is_raised():
+    with pytest.raises(RuntimeError, match="COPY failed"):
+        list(arrow_batches(FailingConnection(), select([missing.c.x])))
+
+
+def test_copy_error_is_raised(pg_engine):
+    with pytest.raises(Exception, match="no_such_table"):
+        fetch_arrow(pg_engine, select([missing.c.x]))
+
+
+def test_copy_nulls_and_empty_strings(pg_engine):
+    stmt = union_all(
+        select([literal("", String).label("s")]),
+        select([cast(null(), String).label("s")]),
+        select([literal('a,"b\n', String).label("s")]),
+    )
+    assert fetch_arrow(pg_engine, stmt).column(0).to_pylist() == ["", None, 'a,"b\n']
+
+
+def test_copy_closed_early_is_cancelled(pg_engine):
+    stmt = select([func.generate_series(1, 5000000).label("x")])
+    with pg_engine.connect() as connection:
+        transaction = connection.begin()
+        batches = arrow_batches(connection, stmt, batch_size=1000)
+        assert next(batches).num_rows == 1000
+        batches.close()
+        transaction.rollback()
+        assert connection.execute("SELECT 1").scalar() == 1
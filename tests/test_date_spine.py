@@ -0,0 +1,41 @@
+import datetime as dt
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from orm.queries.date_spine import date_spine, iter_dates
+
+RANGES = [
+    (dt.date(2020, 1, 31), dt.date(2021, 3, 31), "1 month"),
+    (dt.date(2020, 1, 31), dt.date(2020, 6, 30), "2 months"),
+    (dt.date(2020, 2, 29), dt.date(2024, 3, 1), "1 year"),
+    (dt.date(2020, 1, 1), dt.date(2020, 4, 1), "1 day"),
+    (dt.date(2020, 1, 1), dt.date(2020, 4, 1), "2 weeks"),
+    (dt.date(2020, 1, 5), dt.date(2020, 1, 5), "1 month"),
+    (dt.date(2020, 5, 1), dt.date(2020, 4, 1), "1 day"),
+]
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def session(request):
+    if request.param == "sqlite":
+        engine = create_engine("sqlite://")
+    else:
+        engine = request.getfixturevalue("pg_engine")
+    session = Session(bind=engine)
+    yield session
+    session.close()
+
+
+@pytest.mark.parametrize("start, end, step", RANGES)
+def test_spine_is_iter_dates(session, start, end, step):
+    spine = date_spine(session, start, end, step)
+    dates = [row.date for row in session.query(spine)]
+    assert dates == list(iter_dates(start, end, step))
+
+
+def test_monthly_spine_stays_on_month_ends(session):
+    spine = date_spine(session, dt.date(2020, 1, 31), dt.date(2020, 6, 30), "1 month")
+    dates = [row.date for row in session.query(spine)]
+    assert [date.day for date in dates] == [31, 29, 31, 30, 31, 30]
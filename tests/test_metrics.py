@@ -0,0 +1,25 @@
+import metrics
+from orm.queries.statement_cache import StatementCache
+
+
+def test_registered_cache_is_exported():
+    registry = metrics.Metrics()
+    cache = StatementCache(maxsize=1)
+    registry.register_cache("report", cache)
+    cache.get("a", lambda: "compiled a")
+    cache.get("a", lambda: "compiled a")
+    cache.get("b", lambda: "compiled b")
+
+    lines = registry.render_prometheus().splitlines()
+    assert "# TYPE db_cache_hits_total counter" in lines
+    assert "# TYPE db_cache_size gauge" in lines
+    assert 'db_cache_hits_total{cache="report"} 1' in lines
+    assert 'db_cache_misses_total{cache="report"} 2' in lines
+    assert 'db_cache_evictions_total{cache="report"} 1' in lines
+    assert 'db_cache_size{cache="report"} 1' in lines
+
+
+def test_report_cache_is_in_the_file_export(tmp_path):
+    path = tmp_path / "db.prom"
+    metrics.write_prometheus(str(path))
+    assert 'db_cache_size{cache="report"}' in path.read_text()
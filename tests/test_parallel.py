@@ -0,0 +1,41 @@
+import datetime as dt
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from orm.queries.cross_join import clear_data, create_schema, seed_data
+from orm.queries.cross_join import full_cross_join_on_two_variables_query
+from orm.queries.parallel import COLUMNS, parallel_report
+from orm.queries.statement_cache import cached_report
+
+pd = pytest.importorskip("pandas")
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def session(request, tmp_path):
+    if request.param == "sqlite":
+        engine = create_engine(f"sqlite:///{tmp_path / 'parallel.db'}")
+    else:
+        engine = request.getfixturevalue("pg_engine")
+    create_schema(engine)
+    session = Session(bind=engine)
+    clear_data(session)
+    seed_data(session)
+    yield session
+    clear_data(session)
+    session.close()
+
+
+@pytest.mark.parametrize("by", ["date", "recipe"])
+def test_partitions_merge_into_the_report(session, by):
+    # monthly from the 31st, a partition restarted on 04-30 would step on the 30th
+    start, end = dt.date(2020, 1, 31), dt.date(2020, 7, 31)
+    report = full_cross_join_on_two_variables_query
+    rows = cached_report(session, report, start, end, "1 month")
+    expected = pd.DataFrame.from_records(rows, columns=COLUMNS)
+
+    frame = parallel_report(
+        session, start, end, "1 month", by=by, partition_count=3, workers=3
+    )
+    pd.testing.assert_frame_equal(frame.reset_index(drop=True), expected)
@@ -0,0 +1,108 @@
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+from sqlalchemy import Column, Date, Float, Integer
+from sqlalchemy.ext.declarative import declarative_base
+
+from orm.bulk import default_columns
+
+ROOT = Path(__file__).resolve().parent.parent
+
+Base = declarative_base()
+
+
+class Executed(Base):
+    """
+    Keyed like executedrecipe with DB_PARTITION_EXECUTEDRECIPE=1: the table's
+    primary key holds the partition key, the mapper's is id alone.
+    """
+
+    __tablename__ = "executed"
+
+    id = Column(Integer(), primary_key=True, autoincrement=True)
+    date = Column(Date(), primary_key=True)
+    quantity = Column(Float(), nullable=False)
+
+    __mapper_args__ = {"primary_key": [id]}
+
+
+def test_partition_key_is_a_default_column():
+    assert default_columns(Executed) == ["date", "quantity"]
+
+
+# orm.models reads DB_PARTITION_EXECUTEDRECIPE at import, so the partitioned
+# schema is created and used by another interpreter, in a schema of its own
+PARTITIONED = """
+import datetime as dt
+
+from sqlalchemy.orm import Session
+
+from engine import get_engine
+from orm.bulk import bulk_delete
+from orm.models import ExecutedRecipe
+from orm.partitions import create_month_partitions, is_partitioned
+from orm.partitions import list_partitions
+from orm.queries.cross_join import clear_data, create_schema, seed_data
+from orm.queries.cross_join import full_cross_join_on_two_variables_query
+from orm.queries.statement_cache import cached_report
+
+engine = get_engine()
+create_schema(engine)
+assert is_partitioned(engine)
+session = Session(bind=engine)
+clear_data(session)
+# tuple rows in default_columns() order, the partition key date included
+seed_data(session)
+
+# the seeded rows move out of the default partition
+create_month_partitions(engine, dt.date(2020, 1, 1), dt.date(2020, 2, 1))
+assert [name for name, _ in list_partitions(engine)] == [
+    "executedrecipe_2020_01",
+    "executedrecipe_2020_02",
+    "executedrecipe_default",
+]
+assert not engine.execute("SELECT count(*) FROM executedrecipe_default").scalar()
+
+rows = cached_report(
+    session,
+    full_cross_join_on_two_variables_query,
+    dt.date(2020, 1, 1),
+    dt.date(2020, 2, 1),
+)
+assert len(rows) == 2 * 9 * 2
+
+# the fetched keys identify the objects by the mapper's primary key, id
+executed = session.query(ExecutedRecipe).filter_by(ingredient_id=1).one()
+criteria = ExecutedRecipe.ingredient_id == 1
+bulk_delete(session, ExecutedRecipe, criteria, synchronize_session="fetch")
+assert executed not in session
+clear_data(session)
+"""
+
+
+def test_partitioned_executedrecipe(pg_engine):
+    schema = "test_partitions"
+    with pg_engine.begin() as connection:
+        connection.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        connection.execute(f"CREATE SCHEMA {schema}")
+    url = pg_engine.url
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"{url}?options=-csearch_path%3D{schema}",
+        DB_PARTITION_EXECUTEDRECIPE="1",
+        PYTHONPATH=str(ROOT),
+    )
+    try:
+        subprocess.run(
+            [sys.executable, "-c", textwrap.dedent(PARTITIONED)],
+            env=env,
+            cwd=ROOT,
+            check=True,
+        )
+    finally:
+        with pg_engine.begin() as connection:
+            connection.execute(f"DROP SCHEMA {schema} CASCADE")
@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from orm.models import Address, Base, User
+from orm.readonly import ReadOnlySession
+
+DELETE = text("DELETE FROM example_user")
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def engine(request):
+    if request.param == "sqlite":
+        # one connection, reused by every session
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+    else:
+        engine = request.getfixturevalue("pg_engine")
+    Base.metadata.create_all(engine)
+    session = Session(bind=engine)
+    session.query(Address).delete()
+    session.query(User).delete()
+    session.add(User(name="ed"))
+    session.commit()
+    session.close()
+    return engine
+
+
+def count(bind):
+    return Session(bind=bind).query(User).count()
+
+
+def test_textual_write_is_refused(engine):
+    session = ReadOnlySession(bind=engine)
+    with pytest.raises(DBAPIError):
+        session.execute(DELETE)
+    session.close()
+    assert count(engine) == 1
+
+
+def test_connection_writes_again_after_the_session(engine):
+    session = ReadOnlySession(bind=engine)
+    assert session.query(User.name).all() == [("ed",)]
+    session.close()
+
+    session = Session(bind=engine)
+    session.execute(DELETE)
+    session.commit()
+    assert count(engine) == 0
+
+
+def test_bound_connection_writes_again_after_the_session(engine):
+    with engine.connect() as connection:
+        session = ReadOnlySession(bind=connection)
+        with pytest.raises(DBAPIError):
+            session.execute(DELETE)
+        session.close()
+
+        connection.execute(DELETE)
+        assert count(connection) == 0
@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from orm.bulk import bulk_update
+from orm.models import Base, User
+from orm.result_cache import CachingQuery, ResultCache
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cache.db'}")
+    Base.metadata.create_all(engine)
+    session = Session(bind=engine, query_cls=CachingQuery)
+    session.add(User(id=1, name="ed"))
+    session.commit()
+    yield session
+    session.close()
+
+
+def names(session, cache):
+    return [user.name for user in session.query(User).from_cache(cache)]
+
+
+def test_bulk_write_after_failed_flush_invalidates(session):
+    cache = ResultCache()
+    cache.listen(session)
+    assert names(session, cache) == ["ed"]
+
+    session.add(User(id=1, name="duplicate"))
+    with pytest.raises(IntegrityError):
+        session.flush()
+    session.rollback()
+
+    bulk_update(session, User, [{"id": 1, "name": "wendy"}])
+    session.commit()
+    assert names(session, cache) == ["wendy"]